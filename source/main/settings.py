@@ -27,6 +27,15 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# Production startup profile: templates are compiled once per process by
+# the cached loader and main.wsgi warms the URLconf, the templates and the
+# autocomplete indexes before the first request. BLOG_ADMIN=0 leaves the
+# admin out of INSTALLED_APPS and the URLconf.
+
+PRODUCTION = os.environ.get('BLOG_PRODUCTION') == '1'
+ADMIN_ENABLED = os.environ.get('BLOG_ADMIN', '1') == '1'
+WARM_UP_ON_START = PRODUCTION
+
 
 # Application definition
 
@@ -41,8 +50,14 @@ INSTALLED_APPS = [
     'webapp',
 ]
 
+if not ADMIN_ENABLED:
+    INSTALLED_APPS.remove('django.contrib.admin')
+
 MIDDLEWARE = [
+    'webapp.profiling.ProfilingMiddleware',
+    'webapp.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'webapp.routers.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -69,6 +84,17 @@ TEMPLATES = [
     },
 ]
 
+PRODUCTION_TEMPLATE_LOADERS = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+if PRODUCTION:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = PRODUCTION_TEMPLATE_LOADERS
+
 WSGI_APPLICATION = 'main.wsgi.application'
 
 
@@ -79,9 +105,219 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': int(os.environ.get('BLOG_CONN_MAX_AGE', 60)),
     }
 }
 
+# Safe requests read from a random replica, writes and the reads of a
+# client that has just written (for REPLICA_PIN_SECONDS) use 'default'.
+# BLOG_REPLICA=1 adds a local SQLite replica refreshed by sync_replica.
+
+DATABASE_ROUTERS = ['webapp.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 5
+
+if os.environ.get('BLOG_REPLICA') == '1':
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db_replica.sqlite3'),
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    }
+    DATABASE_REPLICAS.append('replica')
+
+# PRAGMAs run on every new SQLite connection. WAL lets readers work while
+# a comment is written, synchronous=NORMAL is durable across crashes of
+# the process (not of the OS) in WAL mode.
+
+SQLITE_PROFILE = {
+    'ENABLED': os.environ.get('BLOG_SQLITE_PROFILE', '1') == '1',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+
+# Maximum number of SQL queries a view may run, by url name.
+# QueryBudgetMiddleware logs a warning (or raises with QUERY_BUDGET_RAISE)
+# when a request goes over it, QueryBudgetTestMixin fails the test.
+# The middleware counts the queries of every request, it only runs with
+# DEBUG or BLOG_QUERY_BUDGET=1.
+
+QUERY_BUDGET_MIDDLEWARE = DEBUG or os.environ.get('BLOG_QUERY_BUDGET') == '1'
+
+if QUERY_BUDGET_MIDDLEWARE:
+    MIDDLEWARE.append('webapp.querybudget.QueryBudgetMiddleware')
+
+QUERY_BUDGETS = {
+    'index': 6,
+    'article_view': 4,
+    'popular_articles': 1,
+    'article_search': 3,
+    'comment_index': 1,
+    'api_article_list': 4,
+    'api_article_detail': 3,
+    'api_tag_list': 1,
+    'api_category_list': 1,
+    'autocomplete': 0,
+}
+
+QUERY_BUDGET_RAISE = False
+
+
+# Paginate the article index and article comments by (created_at, id)
+# cursors instead of page numbers, no COUNT(*) and no OFFSET.
+
+CURSOR_PAGINATION = False
+
+
+# Number of tag name -> id pairs kept in memory by webapp.tags.
+
+TAG_CACHE_SIZE = 1024
+
+# Tags on more articles than this are filtered with a join on the
+# article-tag table instead of a cached list of article ids.
+
+TAG_FILTER_MAX_IDS = 5000
+
+# Autocomplete indexes follow the writes of their own process through
+# signals. Writes made by other workers show up when an index is reloaded,
+# in a background thread, RELOAD_INTERVAL seconds after it was loaded.
+
+AUTOCOMPLETE_RELOAD_INTERVAL = 5 * 60
+
+
+# Queue comments posted on article pages and write them in batches from a
+# background thread. The queue lives in the process, so a client is shown
+# its own comment when the redirect lands on the worker that queued it.
+# A batch that fails with a database error, such as a lock timeout, is
+# retried up to RETRIES more times, RETRY_DELAY seconds apart and doubling.
+
+COMMENT_WRITE_BEHIND = {
+    'ENABLED': False,
+    'BATCH_SIZE': 100,
+    'MAX_DELAY': 0.5,
+    'RETRIES': 5,
+    'RETRY_DELAY': 0.2,
+}
+
+
+# Article views are counted in memory and added to hourly counter rows by
+# a background thread every FLUSH_INTERVAL seconds; the popular articles
+# of the last POPULAR_WINDOW_DAYS are ranked every POPULAR_REFRESH_INTERVAL
+# seconds. Counts not yet flushed are lost when a process dies.
+
+VIEW_COUNTS = {
+    'ENABLED': os.environ.get('BLOG_VIEW_COUNTS', '1' if PRODUCTION else '0') == '1',
+    'FLUSH_INTERVAL': 10,
+    'POPULAR_REFRESH_INTERVAL': 5 * 60,
+    'POPULAR_WINDOW_DAYS': 7,
+    'POPULAR_SIZE': 20,
+    'RETENTION_DAYS': 30,
+}
+
+
+# Related articles by shared tags, see webapp.related. The
+# build_related_articles command fills the table, tag changes update the
+# affected lists as they commit. Tags on more than MAX_TAG_ARTICLES
+# articles do not propose neighbours by themselves.
+
+RELATED_ARTICLES = {
+    'COUNT': 5,
+    'METRIC': 'cosine',
+    'MAX_TAG_ARTICLES': 2000,
+}
+
+
+# Request profiling: Server-Timing headers and a buffer of the slowest
+# requests, served to staff at /debug/slow-requests/.
+
+PROFILING = {
+    'ENABLED': os.environ.get('BLOG_PROFILING') == '1',
+    'SLOW_REQUEST_MS': 200,
+    'BUFFER_SIZE': 50,
+    'TOP_QUERIES': 5,
+}
+
+
+# Response compression: brotli when the brotli package is installed and
+# accepted, gzip otherwise. Compressed bodies of pages with an ETag are
+# cached for CACHE_TIMEOUT seconds under a digest of their content.
+
+COMPRESSION = {
+    'ENABLED': os.environ.get('BLOG_COMPRESSION', '1') == '1',
+    'MIN_LENGTH': 200,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+    'CACHE_TIMEOUT': 60 * 60,
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# File based alternative:
+# 'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+# 'LOCATION': os.path.join(BASE_DIR, 'cache'),
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'blog',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'search',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+BLOG_CACHE_ALIAS = 'default'
+
+# Version stamps and generations in the blog cache only reach every worker
+# when its backend is shared between processes. With a per-process
+# LocMemCache the caches built on them stay off unless BLOG_SINGLE_PROCESS=1
+# declares a single worker process.
+
+BLOG_CACHE_SINGLE_PROCESS = os.environ.get('BLOG_SINGLE_PROCESS') == '1'
+
+# Seconds a rendered article list entry stays cached. Entries are keyed
+# by the article version, so writes never wait for this to expire.
+
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Full-page cache for anonymous GETs of the index and article pages.
+# A page is rebuilt by one request at a time; the others are served the
+# outdated copy, or wait up to WAIT seconds when there is none.
+# The rebuild lock lives in the blog cache too, so the page cache is gated
+# like the fragments above.
+
+PAGE_CACHE = {
+    'ENABLED': os.environ.get('BLOG_PAGE_CACHE') == '1',
+    'SINGLE_PROCESS': BLOG_CACHE_SINGLE_PROCESS,
+    'TIMEOUT': 60 * 60,
+    'LOCK_TIMEOUT': 10,
+    'WAIT': 2.0,
+    'POLL_INTERVAL': 0.05,
+}
+
+# Search results are kept as ordered id lists in their own LRU cache. Keys
+# include the content generation, the timeout only bounds memory. Results
+# longer than SEARCH_CACHE_MAX_IDS are not cached.
+
+SEARCH_CACHE_ALIAS = 'search'
+SEARCH_CACHE_TIMEOUT = 60 * 10
+SEARCH_CACHE_MAX_IDS = 5000
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -13,11 +13,12 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path
 
 from webapp.views import IndexView, ArticleCreateView, ArticleView, ArticleUpdateView, ArticleDeleteView, \
-    CommentCreateView, CommentIndexView, CommentUpdateView, CommentDeleteView, CommentForArticleCreateView, ArticleSearchView
+    CommentCreateView, CommentIndexView, CommentUpdateView, CommentDeleteView, CommentForArticleCreateView, ArticleSearchView, \
+    SlowRequestsView, PopularArticlesView, ArticleListApiView, ArticleDetailApiView, TagListApiView, CategoryListApiView, AutocompleteView
 
 urlpatterns = [
     path('', IndexView.as_view(), name='index'),
@@ -26,10 +27,21 @@ urlpatterns = [
     path('article/<int:pk>/edit/', ArticleUpdateView.as_view(), name='article_update'),
     path('article/<int:pk>/delete/', ArticleDeleteView.as_view(), name='article_delete'),
     path('article/search/', ArticleSearchView.as_view(), name='article_search'),
+    path('article/popular/', PopularArticlesView.as_view(), name='popular_articles'),
     path('comment/add/', CommentCreateView.as_view(), name='comment_add'),
     path('comment/', CommentIndexView.as_view(), name='comment_index'),
     path('comment/<int:pk>/edit/', CommentUpdateView.as_view(), name='comment_update'),
     path('comment/<int:pk>/delete/', CommentDeleteView.as_view(), name='comment_delete'),
     path('article/<int:pk>/add-comment/', CommentForArticleCreateView.as_view(), name='article_comment_create'),
-    path('admin/', admin.site.urls),
+    path('api/articles/', ArticleListApiView.as_view(), name='api_article_list'),
+    path('api/articles/<int:pk>/', ArticleDetailApiView.as_view(), name='api_article_detail'),
+    path('api/tags/', TagListApiView.as_view(), name='api_tag_list'),
+    path('api/categories/', CategoryListApiView.as_view(), name='api_category_list'),
+    path('api/autocomplete/', AutocompleteView.as_view(), name='autocomplete'),
+    path('debug/slow-requests/', SlowRequestsView.as_view(), name='slow_requests'),
 ]
+
+if settings.ADMIN_ENABLED:
+    from django.contrib import admin
+
+    urlpatterns.append(path('admin/', admin.site.urls))
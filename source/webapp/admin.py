@@ -1,25 +1,120 @@
+from collections import Counter
+
 from django.contrib import admin
+from django.forms.models import BaseInlineFormSet
+from django.utils.html import format_html_join
+
+from webapp import autocomplete, search
 from webapp.models import Article, Comment, Category, Tag
+from webapp.pagination import ApproximateCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
 
+class CommentPageFormSet(BaseInlineFormSet):
+    per_page = 20
+    page = 0
 
-class CommentAdmin(admin.TabularInline):
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            start = self.page * self.per_page
+            self._queryset = super().get_queryset()[start:start + self.per_page]
+        return self._queryset
+
+
+class CommentInline(admin.TabularInline):
     model = Comment
-    fields = ['author', 'text']
-    readonly_fields = ['author', 'text']
+    fields = ['author', 'text', 'created_at']
+    readonly_fields = ['author', 'text', 'created_at']
     extra = 0
+    ordering = ['-created_at', '-id']
+    formset = CommentPageFormSet
+    page_param = 'comments_page'
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        try:
+            formset.page = max(int(request.GET.get(self.page_param, 0)), 0)
+        except ValueError:
+            pass
+        return formset
+
+
+class AuthorFilter(admin.SimpleListFilter):
+    """
+    The most active authors of the latest sample_size articles instead of
+    a DISTINCT over every article. Any other author still filters through
+    ?author=<name>.
+    """
+    title = 'Автор'
+    parameter_name = 'author'
+    max_choices = 20
+    sample_size = 1000
 
+    def lookups(self, request, model_admin):
+        latest = Article.objects.order_by('-created_at', '-id').values_list('author', flat=True)[:self.sample_size]
+        authors = [author for author, count in Counter(latest).most_common(self.max_choices)]
+        if self.value() and self.value() not in authors:
+            authors.append(self.value())
+        return [(author, author) for author in authors]
 
-class ArticleAdmin(admin.ModelAdmin):
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(author__iexact=self.value())
+        return queryset
+
+
+class ArticleAdmin(LargeTableAdmin):
     list_display = ['id', 'title', 'author', 'created_at']
-    list_filter = ['author', 'category']
+    list_filter = [AuthorFilter, 'category']
     search_fields = ['title', 'text']
-    filter_horizontal = ['tags']
+    autocomplete_fields = ['tags']
     exclude = []
-    readonly_fields = ['created_at', 'updated_at']
-    inlines = [CommentAdmin]
+    readonly_fields = ['created_at', 'updated_at', 'comments_count', 'comment_pages']
+    ordering = ['-created_at', '-id']
+    inlines = [CommentInline]
+    search_limit = 1000
+
+    def comment_pages(self, obj):
+        pages = (obj.comments_count + CommentPageFormSet.per_page - 1) // CommentPageFormSet.per_page
+        return format_html_join(' ', '<a href="?{}={}">{}</a>', (
+            (CommentInline.page_param, page, page + 1) for page in range(pages)
+        ))
+    comment_pages.short_description = 'Страницы комментариев'
+
+    def get_search_results(self, request, queryset, search_term):
+        # every word in the title or the text, as the default icontains search
+        terms = search_term.split()
+        if not search.can_match(terms) or not search.is_available():
+            return super().get_search_results(request, queryset, search_term)
+        ids = search.search_article_ids(terms, ['title', 'text'], limit=self.search_limit)
+        return queryset.filter(pk__in=ids), False
+
+
+class CommentAdmin(LargeTableAdmin):
+    list_display = ['id', 'author', 'article', 'created_at']
+    list_select_related = ['article']
+    raw_id_fields = ['article']
+    ordering = ['-created_at', '-id']
+
+
+class TagAdmin(admin.ModelAdmin):
+    search_fields = ['name']
+    ordering = ['name']
+    search_limit = 20
+
+    def get_search_results(self, request, queryset, search_term):
+        # prefix matches from the autocomplete index, most used first
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        names = autocomplete.tags.lookup(search_term, self.search_limit)
+        return queryset.filter(name__in=names), False
 
 
 admin.site.register(Article, ArticleAdmin)
-admin.site.register(Comment)
+admin.site.register(Comment, CommentAdmin)
 admin.site.register(Category)
-admin.site.register(Tag)
\ No newline at end of file
+admin.site.register(Tag, TagAdmin)
@@ -0,0 +1,195 @@
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+
+from webapp.models import Article, Comment, Tag
+
+
+logger = logging.getLogger(__name__)
+
+def normalize(value):
+    return ' '.join((value or '').split()).casefold()
+
+
+class PrefixIndex:
+    """
+    Prefix search over a sorted array of normalized keys: every key that
+    starts with a prefix sits in one bisect range, which is what walking a
+    trie would give, without a node object per character. Counts live in a
+    parallel array; the top entries of short, wide prefixes are memoized.
+    """
+
+    MAX_LIMIT = 20
+
+    def __init__(self, items=(), keep_empty=True, memo_depth=2):
+        self.keep_empty = keep_empty
+        self.memo_depth = memo_depth
+        self._lock = threading.Lock()
+        merged = {}
+        for value, count in items:
+            key = normalize(value)
+            if not key:
+                continue
+            if key in merged:
+                merged[key][1] += count
+            else:
+                merged[key] = [value, count]
+        self._keys = sorted(merged)
+        # the display value shares the key string when they are equal
+        self._values = [key if merged[key][0] == key else merged[key][0] for key in self._keys]
+        self._counts = array('q', (merged[key][1] for key in self._keys))
+        self._memo = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _find(self, key):
+        i = bisect_left(self._keys, key)
+        return i, i < len(self._keys) and self._keys[i] == key
+
+    def _forget(self, key):
+        for length in range(min(len(key), self.memo_depth) + 1):
+            self._memo.pop(key[:length], None)
+
+    def add(self, value, delta=1):
+        key = normalize(value)
+        if not key:
+            return
+        with self._lock:
+            i, found = self._find(key)
+            if found:
+                self._counts[i] += delta
+                if self._counts[i] <= 0 and not self.keep_empty:
+                    del self._keys[i], self._values[i], self._counts[i]
+            elif delta > 0 or (delta == 0 and self.keep_empty):
+                self._keys.insert(i, key)
+                self._values.insert(i, key if value == key else value)
+                self._counts.insert(i, delta)
+            self._forget(key)
+
+    def remove(self, value):
+        key = normalize(value)
+        with self._lock:
+            i, found = self._find(key)
+            if found:
+                del self._keys[i], self._values[i], self._counts[i]
+                self._forget(key)
+
+    def lookup(self, prefix, limit=10):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        return self._top(prefix, limit)
+
+    def top(self, limit=10):
+        """The most used entries overall."""
+        return self._top('', limit)
+
+    def _top(self, prefix, limit):
+        limit = min(limit, self.MAX_LIMIT)
+        if limit < 1:
+            return []
+        with self._lock:
+            memoize = len(prefix) <= self.memo_depth
+            if memoize and prefix in self._memo:
+                return self._memo[prefix][:limit]
+            start = bisect_left(self._keys, prefix)
+            end = bisect_left(self._keys, prefix + '\U0010ffff', start)
+            counts = self._counts
+            top = heapq.nlargest(self.MAX_LIMIT if memoize else limit, range(start, end), key=counts.__getitem__)
+            result = [self._values[i] for i in top]
+            if memoize:
+                self._memo[prefix] = result
+            return result[:limit]
+
+
+class Autocomplete:
+    """
+    A PrefixIndex loaded from the database on first use and then kept
+    current by signals, so lookups never query. Signals only reach the
+    process that wrote, so the index is also reloaded in a background
+    thread AUTOCOMPLETE_RELOAD_INTERVAL seconds after it was loaded; the
+    old one answers meanwhile, and changes applied to it during the
+    reload are only seen again after the next one.
+    """
+
+    def __init__(self, load, keep_empty=True):
+        self.load = load
+        self.keep_empty = keep_empty
+        self.index = None
+        self.loaded_at = None
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    def get_index(self):
+        if self.index is None:
+            with self._lock:
+                if self.index is None:
+                    self.reload()
+        elif time.monotonic() - self.loaded_at >= settings.AUTOCOMPLETE_RELOAD_INTERVAL:
+            self.reload_in_background()
+        return self.index
+
+    def reload(self):
+        index = PrefixIndex(self.load(), keep_empty=self.keep_empty)
+        self.index, self.loaded_at = index, time.monotonic()
+
+    def reload_in_background(self):
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, name='autocomplete-reload', daemon=True).start()
+
+    def _reload(self):
+        try:
+            self.reload()
+        except Exception:
+            # keep the old index until the next interval
+            self.loaded_at = time.monotonic()
+            logger.exception('Could not reload the autocomplete index')
+        finally:
+            self._reloading = False
+            connection.close()
+
+    def lookup(self, prefix, limit=10):
+        return self.get_index().lookup(prefix, limit)
+
+    def top(self, limit=10):
+        return self.get_index().top(limit)
+
+    def add(self, value, delta=1):
+        # applied on commit, a rolled back write must not count
+        transaction.on_commit(lambda: self.index is not None and self.index.add(value, delta))
+
+    def remove(self, value):
+        transaction.on_commit(lambda: self.index is not None and self.index.remove(value))
+
+    def reset(self):
+        self.index = None
+
+
+def load_tags():
+    return Tag.objects.annotate(uses=Count('articles')).values_list('name', 'uses').iterator()
+
+
+def load_authors():
+    for model in (Article, Comment):
+        rows = model.objects.exclude(author=None).values('author').annotate(uses=Count('pk')).order_by()
+        yield from rows.values_list('author', 'uses').iterator()
+
+
+tags = Autocomplete(load_tags)
+authors = Autocomplete(load_authors, keep_empty=False)
+
+KINDS = {
+    'tag': tags,
+    'author': authors,
+}
@@ -0,0 +1,162 @@
+import json
+import statistics
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import URLPattern, get_resolver, reverse
+
+from webapp.models import Article, Comment
+
+
+# Routes that need more than a plain GET to exercise their real work.
+ROUTE_REQUESTS = {
+    'article_comment_create': ('post', {'author': 'bench', 'text': 'Benchmark comment'}),
+    'article_search': ('post', {'text': 'lorem', 'in_title': 'on', 'in_text': 'on', 'in_tags': 'on'}),
+}
+
+
+class SQLTimer:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+
+
+def iter_routes(urlconf=None):
+    for pattern in get_resolver(urlconf).url_patterns:
+        # included URLconfs such as the admin need a login and are skipped
+        if isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern
+
+
+def sample_kwargs(pattern):
+    converters = pattern.pattern.converters
+    if 'pk' not in converters:
+        return {}
+    if pattern.name.startswith('comment_'):
+        model = Comment
+    else:
+        model = Article
+    pk = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    return None if pk is None else {'pk': pk}
+
+
+def measure(client, method, path, data, repeat):
+    walls, sql_times, counts, status = [], [], [], None
+    for _ in range(repeat):
+        timer = SQLTimer()
+        # every request is rolled back so delete and create routes leave
+        # the dataset as it was
+        with transaction.atomic(), ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data)
+            walls.append(time.perf_counter() - start)
+            transaction.set_rollback(True)
+        sql_times.append(timer.duration)
+        counts.append(timer.count)
+        status = response.status_code
+    return {
+        'method': method.upper(),
+        'path': path,
+        'status': status,
+        'wall_ms': round(statistics.median(walls) * 1000, 3),
+        'sql_ms': round(statistics.median(sql_times) * 1000, 3),
+        'queries': max(counts),
+    }
+
+
+def allow_test_client():
+    # the test client talks to 'testserver', outside the test runner that
+    # host has to be allowed explicitly
+    return override_settings(ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver'])
+
+
+def run(repeat=5, urlconf=None):
+    client = Client()
+    results = {}
+    with allow_test_client():
+        for pattern in iter_routes(urlconf):
+            kwargs = sample_kwargs(pattern)
+            if kwargs is None:
+                continue
+            method, data = ROUTE_REQUESTS.get(pattern.name, ('get', {}))
+            path = reverse(pattern.name, kwargs=kwargs, urlconf=urlconf)
+            results[pattern.name] = measure(client, method, path, data, repeat)
+    return results
+
+
+# HTML route, its JSON counterpart, and whether both show one article
+# with a page of comments instead of a page of articles
+API_PAIRS = [
+    ('index', 'api_article_list', False),
+    ('article_view', 'api_article_detail', True),
+]
+HTML_PAGE_SIZE = 3
+
+
+def per_object(repeat=5, page_sizes=(3, 20, 100)):
+    """
+    Time every HTML view next to its JSON API at several page sizes and
+    divide the wall time by the objects on the page. A detail page counts
+    the article and its comments.
+    """
+    client = Client()
+    article = Article.objects.order_by('-pk').values('pk', 'comments_count').first()
+    articles = Article.objects.count()
+    rows = []
+    with allow_test_client():
+        for html_name, api_name, detail in API_PAIRS:
+            if detail and article is None:
+                continue
+            kwargs = {'pk': article['pk']} if detail else {}
+            for name, size in [(html_name, HTML_PAGE_SIZE)] + [(api_name, size) for size in page_sizes]:
+                data = {'page_size': size} if name == api_name else {}
+                result = measure(client, 'get', reverse(name, kwargs=kwargs), data, repeat)
+                objects = 1 + min(size, article['comments_count']) if detail else min(size, articles)
+                result.update(route=name, page_size=size, objects=objects,
+                              ms_per_object=round(result['wall_ms'] / max(objects, 1), 3))
+                rows.append(result)
+    return rows
+
+
+def compare(results, baseline, tolerance=0.5, min_delta_ms=2.0):
+    """
+    Return a list of human readable regressions: more queries than the
+    baseline, or wall/SQL time over baseline * (1 + tolerance) by more
+    than min_delta_ms.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            regressions.append('{}: {} queries, baseline {}'.format(name, result['queries'], base['queries']))
+        for metric in ('wall_ms', 'sql_ms'):
+            limit = base[metric] * (1 + tolerance)
+            if result[metric] > limit and result[metric] - base[metric] > min_delta_ms:
+                regressions.append('{}: {} {}, baseline {}'.format(name, metric, result[metric], base[metric]))
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
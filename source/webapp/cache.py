@@ -0,0 +1,154 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+def get_cache():
+    return caches[settings.BLOG_CACHE_ALIAS]
+
+
+def is_shared():
+    # stamps bumped by one process are invisible to the others in their own LocMemCache
+    return settings.BLOG_CACHE_SINGLE_PROCESS or not isinstance(get_cache(), LocMemCache)
+
+
+def _version_key(scope, pk):
+    return 'version:{}:{}'.format(scope, pk)
+
+
+def new_version():
+    # unique, and starting with the time of the bump for Last-Modified
+    return '{:.6f}-{}'.format(time.time(), uuid.uuid4().hex)
+
+
+def version_time(version):
+    return float(version.split('-', 1)[0])
+
+
+def get_versions(scope, pks):
+    """
+    Return the current version stamp of every object, creating missing ones.
+    A bump replaces the stamp with a fresh random one, so anything cached
+    under an older stamp can never be read again.
+    """
+    cache = get_cache()
+    keys = {_version_key(scope, pk): pk for pk in pks}
+    versions = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+    for key, pk in keys.items():
+        if pk not in versions:
+            cache.add(key, new_version(), None)
+            versions[pk] = cache.get(key)
+    return versions
+
+
+def bump_versions(scope, pks):
+    pks = [pk for pk in set(pks) if pk is not None]
+    if pks:
+        _set_versions(scope, pks)
+        # again once the write is visible, like bump_generation
+        transaction.on_commit(lambda: _set_versions(scope, pks))
+
+
+def _set_versions(scope, pks):
+    get_cache().set_many({_version_key(scope, pk): new_version() for pk in pks}, None)
+
+
+# version stamps of whole article pages, see webapp.pagecache
+PAGE_SCOPE = 'article_page'
+
+
+def bump_article_pages(article_ids):
+    bump_versions(PAGE_SCOPE, article_ids)
+
+
+GENERATION_KEY = 'generation:content'
+# bumped by writes to what article lists show: articles, tags, categories
+LISTING_KEY = 'generation:listing'
+
+
+def get_generation(key=GENERATION_KEY):
+    """
+    Timestamp of the last content write anywhere on the site, used as a
+    cheap validator for pages that list many objects. With LISTING_KEY,
+    of the last write that article lists show, comments left out.
+    """
+    cache = get_cache()
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def get_listing_generation():
+    return get_generation(LISTING_KEY)
+
+
+def _set_generation(keys):
+    now = time.time()
+    get_cache().set_many({key: now for key in keys}, None)
+
+
+def bump_generation(listing=True):
+    keys = [GENERATION_KEY, LISTING_KEY] if listing else [GENERATION_KEY]
+    _set_generation(keys)
+    # bump again once the write is visible, a reader that picked up the
+    # first bump before the commit may have cached the old content under it
+    transaction.on_commit(lambda: _set_generation(keys))
+
+
+class FragmentCache:
+    """
+    Rendered fragments keyed by the version of their object. The objects
+    are loaded before their versions are read, so a fragment is only stored
+    when its version is older than the object's _loaded_at time: a version
+    set after the load may belong to a write the object does not show yet.
+    Nothing is cached unless the blog cache is shared, see is_shared().
+    """
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _key(self, pk, version):
+        return 'fragment:{}:{}:{}'.format(self.scope, pk, version)
+
+    def render_many(self, objects, render):
+        if not is_shared():
+            with self._lock:
+                self.misses += len(objects)
+            return [render(obj) for obj in objects]
+        cache = get_cache()
+        versions = get_versions(self.scope, [obj.pk for obj in objects])
+        keys = [self._key(obj.pk, versions[obj.pk]) for obj in objects]
+        cached = cache.get_many(keys)
+        missing = {}
+        fragments = []
+        for obj, key in zip(objects, keys):
+            if key in cached:
+                fragments.append(cached[key])
+                continue
+            fragment = render(obj)
+            if version_time(versions[obj.pk]) < getattr(obj, '_loaded_at', 0):
+                missing[key] = fragment
+            fragments.append(fragment)
+        if missing:
+            cache.set_many(missing, settings.FRAGMENT_CACHE_TIMEOUT)
+        with self._lock:
+            self.hits += len(cached)
+            self.misses += len(objects) - len(cached)
+        return fragments
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+article_fragments = FragmentCache('article')
@@ -0,0 +1,194 @@
+import hashlib
+import struct
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+from webapp.cache import get_cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# mtime 0, no flags, unknown OS: the same page always compresses to the same bytes
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+# {% csrf_token %} output, different on every request
+CSRF_MARKER = b'name="csrfmiddlewaretoken" value="'
+
+
+def accepted_encodings(request):
+    accepted = {}
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def accepts(request, encoding):
+    # q=0 means "not acceptable"
+    return accepted_encodings(request).get(encoding, 0) > 0
+
+
+def choose_encoding(request):
+    if brotli is not None and accepts(request, 'br'):
+        return 'br'
+    if accepts(request, 'gzip'):
+        return 'gzip'
+    return None
+
+
+def deflate(data, final, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    # a full flush ends on a byte boundary with a fresh dictionary, so the
+    # output can be followed by any other independently deflated segment
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_FULL_FLUSH)
+
+
+def gzip_segments(parts, level):
+    return [deflate(part, i == len(parts) - 1, level) for i, part in enumerate(parts)]
+
+
+def split_tokens(body):
+    """The static parts of body and the CSRF tokens between them."""
+    parts, tokens = [], []
+    start = 0
+    while True:
+        marker = body.find(CSRF_MARKER, start)
+        if marker < 0:
+            break
+        token_start = marker + len(CSRF_MARKER)
+        token_end = body.find(b'"', token_start)
+        if token_end < 0:
+            break
+        parts.append(body[start:token_start])
+        tokens.append(body[token_start:token_end])
+        start = token_end
+    parts.append(body[start:])
+    return parts, tokens
+
+
+def stored_block(data):
+    # random tokens do not compress, they go in as an uncompressed block
+    return struct.pack('<BHH', 0, len(data), len(data) ^ 0xffff) + data
+
+
+def splice_gzip(body, segments, tokens):
+    """A gzip member of body from its precompressed static segments and its tokens."""
+    chunks = [GZIP_HEADER]
+    for i, segment in enumerate(segments):
+        chunks.append(segment)
+        if i < len(tokens):
+            chunks.append(stored_block(tokens[i]))
+    chunks.append(struct.pack('<II', zlib.crc32(body) & 0xffffffff, len(body) & 0xffffffff))
+    return b''.join(chunks)
+
+
+class Compressor:
+    """
+    Compresses response bodies. With cache=True the compressed static
+    parts of a body are kept under a digest of the body without its CSRF
+    tokens, so a page is compressed once per version and a request only
+    splices in its own tokens. Brotli output cannot be spliced, bodies with
+    a token are only ever gzipped.
+    """
+
+    def __init__(self, options):
+        self.gzip_level = options['GZIP_LEVEL']
+        self.brotli_quality = options['BROTLI_QUALITY']
+        self.timeout = options['CACHE_TIMEOUT']
+
+    def compress(self, body, encoding, cache=False):
+        if encoding == 'br':
+            return self.compress_brotli(body, cache)
+        return self.compress_gzip(body, cache)
+
+    def compress_gzip(self, body, cache=False):
+        parts, tokens = split_tokens(body)
+        segments = None
+        if cache:
+            key = self._key('gzip{}'.format(self.gzip_level), parts)
+            segments = get_cache().get(key)
+        if segments is None:
+            segments = gzip_segments(parts, self.gzip_level)
+            if cache:
+                get_cache().set(key, segments, self.timeout)
+        return splice_gzip(body, segments, tokens)
+
+    def compress_brotli(self, body, cache=False):
+        if not cache:
+            return brotli.compress(body, quality=self.brotli_quality)
+        key = self._key('br{}'.format(self.brotli_quality), [body])
+        compressed = get_cache().get(key)
+        if compressed is None:
+            compressed = brotli.compress(body, quality=self.brotli_quality)
+            get_cache().set(key, compressed, self.timeout)
+        return compressed
+
+    def _key(self, encoding, parts):
+        return 'compressed:{}:{}'.format(encoding, hashlib.md5(b'\0'.join(parts)).hexdigest())
+
+
+class CompressionMiddleware:
+    """
+    Negotiated brotli/gzip for every response of at least MIN_LENGTH
+    bytes. Responses with an ETag, the conditional article and index pages,
+    reuse their compressed body through the Compressor cache.
+    """
+
+    def __init__(self, get_response):
+        options = settings.COMPRESSION
+        if not options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.min_length = options['MIN_LENGTH']
+        self.compressor = Compressor(options)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding'):
+            return response
+        if not response.streaming and len(response.content) < self.min_length:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            # streamed exports are gzipped chunk by chunk
+            if encoding != 'gzip' and not accepts(request, 'gzip'):
+                return response
+            response.streaming_content = compress_sequence(response.streaming_content)
+            del response['Content-Length']
+            encoding = 'gzip'
+        else:
+            if encoding == 'br' and CSRF_MARKER in response.content:
+                # compressed along with the page, the token would leak (BREACH)
+                if not accepts(request, 'gzip'):
+                    return response
+                encoding = 'gzip'
+            compressed = self.compressor.compress(response.content, encoding, cache=response.has_header('ETag'))
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
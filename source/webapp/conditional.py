@@ -0,0 +1,54 @@
+import hashlib
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from webapp.cache import PAGE_SCOPE, get_listing_generation, get_versions, is_shared, version_time
+from webapp.models import Article
+
+
+def _hash(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _article_state(request, pk):
+    # etag and last_modified are asked separately, one query serves both.
+    # The page stamp covers what the page shows beyond the article's own
+    # columns, such as its category name
+    if not hasattr(request, '_article_state'):
+        version = get_versions(PAGE_SCOPE, [pk])[pk]
+        state = Article.objects.filter(pk=pk)\
+            .values_list('updated_at', 'last_comment_at', 'comments_count').first()
+        request._article_state = None if state is None else state + (version,)
+    return request._article_state
+
+
+def article_etag(request, pk):
+    state = _article_state(request, pk)
+    if state is None:
+        return None
+    return _hash(pk, *state, request.GET.urlencode(), settings.CURSOR_PAGINATION)
+
+
+def article_last_modified(request, pk):
+    state = _article_state(request, pk)
+    if state is None:
+        return None
+    updated_at, last_comment_at, comments_count, version = state
+    # the stamp also moves when a related article or the category changes
+    bumped_at = datetime.fromtimestamp(version_time(version), tz=timezone.utc)
+    return max(updated_at, last_comment_at or updated_at, bumped_at)
+
+
+def index_etag(request):
+    # no Last-Modified: whole seconds cannot tell apart two writes in one
+    if is_shared():
+        state = get_listing_generation()
+    else:
+        # the generation of this process misses the writes of the others.
+        # Tag and category changes touch updated_at, see webapp.signals
+        state = Article.objects.aggregate(count=Count('id'), updated_at=Max('updated_at'))
+        state = (state['count'], state['updated_at'])
+    return _hash(state, request.GET.urlencode(), settings.CURSOR_PAGINATION)
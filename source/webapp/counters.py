@@ -0,0 +1,36 @@
+from django.db.models import F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Greatest
+
+from webapp.models import Article, Comment
+
+
+def last_comment_subquery():
+    comments = Comment.objects.filter(article=OuterRef('pk')).order_by()\
+        .values('article').annotate(last=Max('updated_at')).values('last')
+    return Subquery(comments)
+
+
+def comments_added(article_id, count, last_comment_at):
+    Article.objects.filter(pk=article_id).update(
+        comments_count=F('comments_count') + count,
+        last_comment_at=last_comment_at,
+    )
+
+
+def comment_added(comment):
+    comments_added(comment.article_id, 1, comment.updated_at)
+
+
+def comment_changed(comment, loaded_article_id):
+    if loaded_article_id != comment.article_id:
+        comment_removed(loaded_article_id)
+        comment_added(comment)
+    else:
+        Article.objects.filter(pk=comment.article_id).update(last_comment_at=comment.updated_at)
+
+
+def comment_removed(article_id):
+    Article.objects.filter(pk=article_id).update(
+        comments_count=Greatest(F('comments_count') - 1, Value(0)),
+        last_comment_at=last_comment_subquery(),
+    )
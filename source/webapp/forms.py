@@ -8,7 +8,7 @@ class ArticleForm(forms.ModelForm):
     tags = forms.CharField(max_length=200, required=False, label='Тэги')
     class Meta:
         model = Article
-        exclude = ['created_at, updated_at']
+        exclude = ['created_at', 'updated_at', 'tags']
 
     def clean_title(self):
         title = self.cleaned_data['title']
@@ -34,7 +34,7 @@ class CommentForm(forms.ModelForm):
 class ArticleCommentForm(forms.ModelForm):
     class Meta:
         model = Comment
-        exclude = []
+        exclude = ['article']
 
 
 class SimpleSearchForm(forms.Form):
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from webapp import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Compares the cost per object of the HTML views and the JSON API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--page-size', type=int, action='append', dest='page_sizes',
+                            help='API page size to measure, may be repeated (default 3, 20, 100)')
+
+    def handle(self, *args, **options):
+        rows = benchmarks.per_object(options['repeat'], options['page_sizes'] or (3, 20, 100))
+        self.stdout.write('{:<20} {:>9} {:>8} {:>10} {:>8} {:>10}'.format(
+            'route', 'page size', 'objects', 'wall ms', 'queries', 'ms/object'))
+        for row in rows:
+            self.stdout.write('{:<20} {:>9} {:>8} {:>10} {:>8} {:>10}'.format(
+                row['route'], row['page_size'], row['objects'], row['wall_ms'], row['queries'], row['ms_per_object']))
@@ -0,0 +1,52 @@
+import random
+import statistics
+import string
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from webapp.autocomplete import PrefixIndex
+
+
+class Command(BaseCommand):
+    help = 'Measures memory and prefix lookup latency of the autocomplete index on synthetic names'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=1000000)
+        parser.add_argument('--lookups', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        letters = string.ascii_lowercase
+        names = [''.join(rng.choices(letters, k=rng.randint(4, 14))) for _ in range(options['entries'])]
+        # zipf-like usage counts
+        items = [(name, int(1000 / rank ** 0.8)) for rank, name in enumerate(names, 1)]
+        del names
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        index = PrefixIndex(items)
+        build = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        self.stdout.write('{} entries: built in {:.2f}s, {:.1f} MB ({:.0f} bytes/entry)'.format(
+            len(index), build, memory / 2 ** 20, memory / max(len(index), 1)))
+
+        self.stdout.write('{:>6} {:>10} {:>10} {:>10}'.format('prefix', 'p50 us', 'p99 us', 'max us'))
+        for length in (1, 2, 3, 4):
+            prefixes = [''.join(rng.choices(letters, k=length)) for _ in range(options['lookups'])]
+            timings = []
+            for prefix in prefixes:
+                start = time.perf_counter()
+                index.lookup(prefix)
+                timings.append((time.perf_counter() - start) * 1e6)
+            timings.sort()
+            self.stdout.write('{:>6} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                length, statistics.median(timings), timings[int(len(timings) * 0.99) - 1], timings[-1]))
+
+        start = time.perf_counter()
+        for name, count in items[:1000]:
+            index.add(name + 'x')
+        self.stdout.write('insert: {:.1f} us each'.format((time.perf_counter() - start) * 1000))
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from webapp import benchmarks, compression
+from webapp.cache import get_cache
+
+
+def cpu_us(function, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        result = function()
+    return (time.process_time() - start) / repeat * 1e6, result
+
+
+class Command(BaseCommand):
+    help = 'Measures the CPU time of compressing every GET page against the bytes it saves'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--level', type=int, action='append', dest='levels',
+                            help='gzip level to measure, may be repeated (default 1, 6, 9)')
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        client = Client()
+        encodings = [('gzip', level) for level in options['levels'] or (1, 6, 9)]
+        if compression.brotli is not None:
+            encodings += [('br', quality) for quality in (1, 5, 11)]
+        else:
+            self.stdout.write('brotli is not installed, measuring gzip only')
+
+        self.stdout.write('{:<22} {:<8} {:>9} {:>9} {:>7} {:>10} {:>10} {:>10}'.format(
+            'route', 'encoding', 'bytes', 'encoded', 'saved', 'cpu us', 'cached us', 'us/KB saved'))
+        with benchmarks.allow_test_client():
+            for pattern in benchmarks.iter_routes():
+                kwargs = benchmarks.sample_kwargs(pattern)
+                if kwargs is None or benchmarks.ROUTE_REQUESTS.get(pattern.name, ('get',))[0] != 'get':
+                    continue
+                response = client.get(reverse(pattern.name, kwargs=kwargs))
+                if response.streaming or response.status_code != 200:
+                    continue
+                body = response.content
+                for encoding, level in encodings:
+                    compressor = compression.Compressor({
+                        'GZIP_LEVEL': level, 'BROTLI_QUALITY': level, 'CACHE_TIMEOUT': 60,
+                    })
+                    cpu, encoded = cpu_us(lambda: compressor.compress(body, encoding), repeat)
+                    # a hit only splices in the CSRF token and checksums the body
+                    get_cache().clear()
+                    compressor.compress(body, encoding, cache=True)
+                    cached, _ = cpu_us(lambda: compressor.compress(body, encoding, cache=True), repeat)
+                    saved = len(body) - len(encoded)
+                    per_kb = '{:.1f}'.format(cpu / saved * 1024) if saved > 0 else '-'
+                    self.stdout.write('{:<22} {:<8} {:>9} {:>9} {:>6.0%} {:>10.0f} {:>10.0f} {:>10}'.format(
+                        pattern.name, '{}-{}'.format(encoding, level), len(body), len(encoded),
+                        saved / max(len(body), 1), cpu, cached, per_kb))
@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from webapp.benchmarks import allow_test_client
+from webapp.models import Article
+
+
+class Command(BaseCommand):
+    help = 'Compares concurrent IndexView reads and comment writes with and without SQLITE_PROFILE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per profile')
+
+    def handle(self, *args, **options):
+        database = connections['default'].settings_dict
+        if connections['default'].vendor != 'sqlite' or database['NAME'] == ':memory:':
+            raise CommandError('bench_sqlite needs a file based SQLite database')
+        article_pk = Article.objects.order_by('-pk').values_list('pk', flat=True).first()
+        if article_pk is None:
+            raise CommandError('The database has no articles, run seed_blog first')
+        self.read_path = reverse('index')
+        self.write_path = reverse('article_comment_create', kwargs={'pk': article_pk})
+
+        source = database['NAME']
+        connections.close_all()
+        self.stdout.write('{:<8} {:>10} {:>10} {:>10} {:>10}'.format(
+            'profile', 'reads/s', 'writes/s', 'read err', 'write err'))
+        try:
+            for tuned in (False, True):
+                with tempfile.TemporaryDirectory() as directory:
+                    path = os.path.join(directory, 'bench.sqlite3')
+                    self.copy_database(source, path, tuned)
+                    database['NAME'] = path
+                    result = self.run_profile(tuned, options)
+                    connections.close_all()
+                self.stdout.write('{:<8} {:>10.1f} {:>10.1f} {:>10} {:>10}'.format(
+                    'tuned' if tuned else 'plain',
+                    result['reads'] / options['duration'], result['writes'] / options['duration'],
+                    result['read_errors'], result['write_errors'],
+                ))
+        finally:
+            database['NAME'] = source
+
+    def copy_database(self, source, path, tuned):
+        with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+            src.backup(dst)
+            if not tuned:
+                dst.execute('PRAGMA journal_mode = DELETE')
+
+    def run_profile(self, tuned, options):
+        database = connections['default'].settings_dict
+        result = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+
+        def work(kind, method, path, data):
+            client = Client()
+            ok = errors = 0
+            while time.monotonic() < deadline:
+                try:
+                    response = getattr(client, method)(path, data)
+                    if response.status_code < 400:
+                        ok += 1
+                    else:
+                        errors += 1
+                except Exception:
+                    errors += 1
+                close_old_connections()
+            connections.close_all()
+            with lock:
+                result[kind + 's'] += ok
+                result[kind + '_errors'] += errors
+
+        conn_max_age = database['CONN_MAX_AGE']
+        database['CONN_MAX_AGE'] = conn_max_age if tuned else 0
+        profile = dict(settings.SQLITE_PROFILE, ENABLED=tuned)
+        try:
+            with override_settings(SQLITE_PROFILE=profile), allow_test_client():
+                threads = [threading.Thread(target=work, args=('read', 'get', self.read_path, {}))
+                           for _ in range(options['readers'])]
+                threads += [threading.Thread(target=work, args=('write', 'post', self.write_path,
+                                                                {'author': 'bench', 'text': 'Benchmark comment'}))
+                            for _ in range(options['writers'])]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        finally:
+            database['CONN_MAX_AGE'] = conn_max_age
+        return result
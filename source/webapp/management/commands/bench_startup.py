@@ -0,0 +1,69 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter: import the WSGI module, then send the same
+# request twice straight to the WSGI callable.
+SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import main.wsgi
+imported = time.perf_counter() - start
+from wsgiref.util import setup_testing_defaults
+
+def request(path):
+    environ = {'PATH_INFO': path}
+    setup_testing_defaults(environ)
+    status = []
+    start = time.perf_counter()
+    b''.join(main.wsgi.application(environ, lambda value, headers, exc_info=None: status.append(value)))
+    return time.perf_counter() - start, status[0]
+
+first, status = request(sys.argv[1])
+second, _ = request(sys.argv[1])
+print(json.dumps({'import': imported, 'first': first, 'second': second, 'status': status}))
+'''
+
+PROFILES = {
+    'default': {},
+    'production': {'BLOG_PRODUCTION': '1'},
+    'production-noadmin': {'BLOG_PRODUCTION': '1', 'BLOG_ADMIN': '0'},
+}
+
+
+class Command(BaseCommand):
+    help = 'Measures main.wsgi import time and first request latency in fresh processes per startup profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--path', default='/')
+        parser.add_argument('--profile', action='append', choices=sorted(PROFILES), dest='profiles')
+
+    def handle(self, *args, **options):
+        self.stdout.write('{:<20} {:>10} {:>12} {:>12} {:>8}'.format(
+            'profile', 'import ms', 'first req ms', 'next req ms', 'status'))
+        for name in options['profiles'] or list(PROFILES):
+            runs = [self.run(PROFILES[name], options['path']) for _ in range(options['runs'])]
+            self.stdout.write('{:<20} {:>10.1f} {:>12.1f} {:>12.1f} {:>8}'.format(
+                name,
+                statistics.median(run['import'] for run in runs) * 1000,
+                statistics.median(run['first'] for run in runs) * 1000,
+                statistics.median(run['second'] for run in runs) * 1000,
+                runs[-1]['status'].split()[0],
+            ))
+
+    def run(self, env, path):
+        base = {key: value for key, value in os.environ.items() if key not in ('BLOG_PRODUCTION', 'BLOG_ADMIN')}
+        base.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+        env = dict(base, **env)
+        result = subprocess.run([sys.executable, '-c', SCRIPT, path], cwd=settings.BASE_DIR, env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if result.returncode:
+            raise CommandError(result.stderr)
+        return json.loads(result.stdout.strip().splitlines()[-1])
@@ -0,0 +1,38 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from webapp import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Times every route of the URLconf and compares it with a stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'bench_baseline.json'))
+        parser.add_argument('--save-baseline', action='store_true')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed relative slowdown before a route counts as a regression')
+
+    def handle(self, *args, **options):
+        results = benchmarks.run(repeat=options['repeat'])
+        self.stdout.write('{:<25} {:<6} {:>6} {:>10} {:>10} {:>8}'.format(
+            'route', 'method', 'status', 'wall ms', 'sql ms', 'queries'))
+        for name, result in sorted(results.items()):
+            self.stdout.write('{:<25} {:<6} {:>6} {:>10} {:>10} {:>8}'.format(
+                name, result['method'], result['status'], result['wall_ms'], result['sql_ms'], result['queries']))
+
+        if options['save_baseline']:
+            benchmarks.save_baseline(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS('Baseline saved to {}'.format(options['baseline'])))
+            return
+        if not os.path.exists(options['baseline']):
+            self.stdout.write('No baseline at {}, run with --save-baseline first'.format(options['baseline']))
+            return
+        regressions = benchmarks.compare(results, benchmarks.load_baseline(options['baseline']),
+                                         tolerance=options['tolerance'])
+        if regressions:
+            raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against {}'.format(options['baseline'])))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from webapp import related
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the related articles of every article from shared tags'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, help='Related articles per article')
+        parser.add_argument('--metric', choices=sorted(related.METRICS))
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT batch')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = related.rebuild(options['count'], options['metric'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Wrote {} related articles in {:.2f}s'.format(
+            written, time.perf_counter() - start)))
@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand, OutputWrapper
+
+from webapp.models import Article, Comment
+
+
+ARTICLE_FIELDS = ('id', 'title', 'text', 'author', 'created_at', 'updated_at', 'category_id', 'category__name')
+COMMENT_FIELDS = ('article_id', 'text', 'author', 'created_at', 'updated_at')
+
+
+def _default(value):
+    # full isoformat, DjangoJSONEncoder would drop the microseconds
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def dump(data):
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(',', ':'))
+
+
+class Command(BaseCommand):
+    help = 'Streams articles with their tags, category and comments as NDJSON, one article line followed by its comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', default='-', help='File to write, - for stdout')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Articles read per query')
+
+    def handle(self, *args, **options):
+        if options['output'] == '-':
+            out, close = self.stdout, None
+        else:
+            close = open(options['output'], 'w', encoding='utf-8')
+            out = OutputWrapper(close)
+        try:
+            articles, comments = self.export(out, options['chunk_size'], options['verbosity'])
+        finally:
+            if close:
+                close.close()
+        self.stderr.write('Exported {} articles, {} comments'.format(articles, comments), self.style.SUCCESS)
+
+    def export(self, out, chunk_size, verbosity=1):
+        last_pk = 0
+        articles = comments = 0
+        while True:
+            # keyset chunks keep one chunk of articles and their tag names in
+            # memory, comments are streamed with a server side iterator
+            chunk = list(Article.objects.filter(pk__gt=last_pk).order_by('pk').values(*ARTICLE_FIELDS)[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1]['id']
+            ids = [row['id'] for row in chunk]
+            tags = {pk: [] for pk in ids}
+            through = Article.tags.through.objects.filter(article_id__in=ids).order_by('tag__name')
+            for article_id, name in through.values_list('article_id', 'tag__name').iterator():
+                tags[article_id].append(name)
+            rows = (Comment.objects.filter(article_id__in=ids).order_by('article_id', 'pk')
+                    .values_list(*COMMENT_FIELDS).iterator(chunk_size=2000))
+            comment = next(rows, None)
+            for row in chunk:
+                out.write(dump({
+                    'type': 'article', 'id': row['id'], 'title': row['title'], 'text': row['text'],
+                    'author': row['author'], 'created_at': row['created_at'], 'updated_at': row['updated_at'],
+                    'category': row['category__name'], 'category_id': row['category_id'], 'tags': tags[row['id']],
+                }))
+                while comment is not None and comment[0] == row['id']:
+                    out.write(dump({
+                        'type': 'comment', 'article': comment[0], 'text': comment[1], 'author': comment[2],
+                        'created_at': comment[3], 'updated_at': comment[4],
+                    }))
+                    comments += 1
+                    comment = next(rows, None)
+            articles += len(chunk)
+            if verbosity > 1:
+                self.stderr.write('{} articles, {} comments'.format(articles, comments))
+        return articles, comments
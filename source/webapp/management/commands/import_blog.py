@@ -0,0 +1,236 @@
+import json
+import multiprocessing
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from webapp import search
+from webapp.cache import bump_generation
+from webapp.management.commands.seed_blog import plain_timestamps
+from webapp.models import Article, Comment, Category
+from webapp.tags import resolve_tags
+
+
+def next_pk(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def iter_units(path, start=0, end=None):
+    """
+    Yield the parsed lines of the articles that start in [start, end) and of
+    the comments that follow them. A worker whose range begins inside an
+    article's comments skips ahead to the next article, the previous worker
+    reads past its end to finish the article it started.
+    """
+    with open(path, 'rb') as f:
+        if start:
+            # finish the line that crosses start, which is a whole line
+            # when start - 1 is its newline
+            f.seek(start - 1)
+            f.readline()
+        inside = False
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if data.get('type') == 'article':
+                if end is not None and offset >= end:
+                    break
+                inside = True
+            elif not inside:
+                continue
+            yield data
+
+
+def split_file(path, workers):
+    size = os.path.getsize(path)
+    step = size // workers + 1
+    return [(i * step, min((i + 1) * step, size)) for i in range(workers)]
+
+
+def category_key(data):
+    # files written before the category id was exported only have the name
+    return data.get('category_id', data['category'])
+
+
+def local_category(name, taken):
+    """
+    Return the pk of the category a source category is imported into. The
+    first source category of a name reuses the oldest local one, later
+    source categories sharing the name get categories of their own.
+    """
+    category = None if name in taken else Category.objects.filter(name=name).order_by('pk').first()
+    taken.add(name)
+    return (category or Category.objects.create(name=name)).pk
+
+
+def count_units(path, start, end):
+    articles = comments = 0
+    categories = {}
+    for data in iter_units(path, start, end):
+        if data['type'] == 'article':
+            articles += 1
+            if data.get('category'):
+                categories.setdefault(category_key(data), data['category'])
+        else:
+            comments += 1
+    return articles, comments, categories
+
+
+class Importer:
+    def __init__(self, article_pk, comment_pk, categories, batch_size, progress=None):
+        self.article_pk = article_pk
+        self.comment_pk = comment_pk
+        self.categories = categories
+        self.taken_names = set()
+        self.batch_size = batch_size
+        self.progress = progress
+        self.articles, self.tags, self.comments = [], [], []
+        self.current = None
+        self.current_written = False
+        self.source_id = None
+        self.imported_articles = self.imported_comments = 0
+
+    def category_id(self, data):
+        if not data.get('category'):
+            return None
+        key = category_key(data)
+        if key not in self.categories:
+            self.categories[key] = local_category(data['category'], self.taken_names)
+        return self.categories[key]
+
+    def run(self, units):
+        with plain_timestamps(Article, Comment):
+            for data in units:
+                if data['type'] == 'article':
+                    self.add_article(data)
+                elif data['type'] == 'comment':
+                    self.add_comment(data)
+                else:
+                    raise CommandError('Unknown line type {!r}'.format(data['type']))
+                if len(self.articles) + len(self.tags) + len(self.comments) >= self.batch_size:
+                    self.flush()
+            self.finish_article()
+            self.flush()
+        return self.imported_articles, self.imported_comments
+
+    def add_article(self, data):
+        self.finish_article()
+        # only the article being read is remapped, its comments follow it
+        self.source_id = data['id']
+        self.current_written = False
+        self.current = Article(
+            pk=self.article_pk, title=data['title'], text=data['text'], author=data['author'],
+            created_at=parse_datetime(data['created_at']), updated_at=parse_datetime(data['updated_at']),
+            category_id=self.category_id(data),
+        )
+        self.article_pk += 1
+        self.articles.append(self.current)
+        Through = Article.tags.through
+        self.tags.extend(Through(article_id=self.current.pk, tag_id=tag_id)
+                         for tag_id in resolve_tags(data.get('tags') or []))
+
+    def add_comment(self, data):
+        if self.current is None or data['article'] != self.source_id:
+            raise CommandError('Comment for article {} does not follow its article'.format(data['article']))
+        comment = Comment(
+            pk=self.comment_pk, article_id=self.current.pk, text=data['text'], author=data['author'],
+            created_at=parse_datetime(data['created_at']), updated_at=parse_datetime(data['updated_at']),
+        )
+        self.comments.append(comment)
+        self.comment_pk += 1
+        self.current.comments_count += 1
+        if self.current.last_comment_at is None or comment.updated_at > self.current.last_comment_at:
+            self.current.last_comment_at = comment.updated_at
+
+    def finish_article(self):
+        # an article with many comments may already have been written by
+        # an earlier batch, its counters are then set with an UPDATE
+        current = self.current
+        if current is not None and current.comments_count and self.current_written:
+            Article.objects.filter(pk=current.pk).update(
+                comments_count=current.comments_count, last_comment_at=current.last_comment_at)
+        self.current = None
+
+    def flush(self):
+        with transaction.atomic():
+            Article.objects.bulk_create(self.articles)
+            Article.tags.through.objects.bulk_create(self.tags)
+            Comment.objects.bulk_create(self.comments)
+        self.imported_articles += len(self.articles)
+        self.imported_comments += len(self.comments)
+        self.articles, self.tags, self.comments = [], [], []
+        self.current_written = self.current is not None
+        if self.progress:
+            self.progress(self.imported_articles, self.imported_comments)
+
+
+def import_range(job):
+    # progress is reported by the parent as the ranges finish
+    path, start, end, article_pk, comment_pk, categories, batch_size = job
+    importer = Importer(article_pk, comment_pk, categories, batch_size)
+    try:
+        return importer.run(iter_units(path, start, end))
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Imports an export_blog NDJSON file with new primary keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per transaction')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes, each importing its own byte range of the file')
+
+    def handle(self, *args, **options):
+        path, workers = options['input'], max(options['workers'], 1)
+        self.verbosity = options['verbosity']
+        if not os.path.exists(path):
+            raise CommandError('{} does not exist'.format(path))
+        article_pk, comment_pk = next_pk(Article), next_pk(Comment)
+        if workers == 1:
+            importer = Importer(article_pk, comment_pk, {}, options['batch_size'], self.progress)
+            articles, comments = importer.run(iter_units(path))
+        else:
+            articles, comments = self.import_parallel(path, workers, article_pk, comment_pk, options['batch_size'])
+        if search.is_available():
+            search.rebuild_index()
+        bump_generation()
+        self.stdout.write(self.style.SUCCESS('Imported {} articles, {} comments'.format(articles, comments)))
+
+    def progress(self, articles, comments):
+        if self.verbosity:
+            self.stdout.write('{} articles, {} comments'.format(articles, comments))
+
+    def import_parallel(self, path, workers, article_pk, comment_pk, batch_size):
+        ranges = split_file(path, workers)
+        # a counting pass gives every worker its own block of primary keys
+        # and creates the categories once instead of racing in the workers
+        counts = [count_units(path, start, end) for start, end in ranges]
+        categories, taken = {}, set()
+        for _, _, names in counts:
+            for key, name in names.items():
+                if key not in categories:
+                    categories[key] = local_category(name, taken)
+        jobs = []
+        for (start, end), (articles, comments, _) in zip(ranges, counts):
+            jobs.append((path, start, end, article_pk, comment_pk, categories, batch_size))
+            article_pk += articles
+            comment_pk += comments
+        connections.close_all()
+        total_articles = total_comments = 0
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            for articles, comments in pool.imap_unordered(import_range, jobs):
+                total_articles += articles
+                total_comments += comments
+                self.progress(total_articles, total_comments)
+        return total_articles, total_comments
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from webapp import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of articles from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Full-text search index is not available, run migrate on an SQLite database first.')
+        total = search.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Indexed {} articles'.format(total)))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max
+
+from webapp.models import Article
+
+
+class Command(BaseCommand):
+    help = 'Recomputes Article.comments_count and Article.last_comment_at where they drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = fixed = 0
+        last_pk = 0
+        while True:
+            rows = list(
+                Article.objects.filter(pk__gt=last_pk).order_by('pk')
+                .annotate(real_count=Count('comments'), real_last=Max('comments__updated_at'))
+                .values_list('pk', 'comments_count', 'last_comment_at', 'real_count', 'real_last')[:batch_size]
+            )
+            if not rows:
+                break
+            for pk, count, last_comment_at, real_count, real_last in rows:
+                if count != real_count or last_comment_at != real_last:
+                    fixed += 1
+                    if options['verbosity'] > 1:
+                        self.stdout.write('Article {}: {} -> {} comments'.format(pk, count, real_count))
+                    if not options['dry_run']:
+                        Article.objects.filter(pk=pk).update(comments_count=real_count, last_comment_at=real_last)
+            checked += len(rows)
+            last_pk = rows[-1][0]
+        self.stdout.write(self.style.SUCCESS('Checked {} articles, {} drifted{}'.format(
+            checked, fixed, ' (dry run)' if options['dry_run'] else ''
+        )))
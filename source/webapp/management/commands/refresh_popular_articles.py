@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from webapp import viewcounts
+from webapp.models import PopularArticle
+
+
+class Command(BaseCommand):
+    help = 'Ranks the popular articles from the hourly view counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Window of view counters to rank by')
+        parser.add_argument('--size', type=int, help='Articles to keep')
+
+    def handle(self, *args, **options):
+        viewcounts.refresh_popular(options['days'], options['size'])
+        self.stdout.write(self.style.SUCCESS('Ranked {} popular articles'.format(PopularArticle.objects.count())))
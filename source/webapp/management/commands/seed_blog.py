@@ -0,0 +1,141 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from webapp import search
+from webapp.cache import bump_generation
+from webapp.models import Article, Comment, Category, Tag
+
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore '
+         'et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip '
+         'ex ea commodo consequat duis aute irure in reprehenderit voluptate velit esse cillum fugiat nulla '
+         'pariatur excepteur sint occaecat cupidatat non proident sunt culpa qui officia deserunt mollit anim '
+         'id est laborum python django sqlite blog article comment tag search index cache page').split()
+
+
+@contextmanager
+def plain_timestamps(*models):
+    # bulk_create honours auto_now/auto_now_add, switch them off so the
+    # generated history keeps its spread-out timestamps
+    fields = [field for model in models for field in model._meta.fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with a reproducible synthetic blog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=10, help='Comments per article')
+        parser.add_argument('--tags', type=int, default=200, help='Size of the tag vocabulary')
+        parser.add_argument('--tags-per-article', type=int, default=3)
+        parser.add_argument('--zipf', type=float, default=1.1, help='Exponent of the tag popularity distribution')
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        with transaction.atomic(), plain_timestamps(Article, Comment, Tag):
+            categories = self.create_categories(options['categories'])
+            tags = self.create_tags(options['tags'])
+            articles = self.create_articles(options['articles'], options['comments'], categories)
+            self.tag_articles(articles, tags, options['tags_per_article'], options['zipf'])
+        if search.is_available():
+            search.rebuild_index()
+        bump_generation()
+        self.stdout.write(self.style.SUCCESS('Created {} articles, {} comments, {} tags, {} categories'.format(
+            options['articles'], options['articles'] * options['comments'], len(tags), len(categories)
+        )))
+
+    def sentence(self, low, high):
+        return ' '.join(self.rng.choices(WORDS, k=self.rng.randint(low, high)))
+
+    def next_pk(self, model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def create_categories(self, count):
+        start = self.next_pk(Category)
+        categories = [Category(pk=start + i, name='category {}'.format(start + i)[:20]) for i in range(count)]
+        Category.objects.bulk_create(categories)
+        return categories
+
+    def create_tags(self, count):
+        existing = set(Tag.objects.values_list('name', flat=True))
+        now = timezone.now()
+        start = self.next_pk(Tag)
+        names = [name for name in ('tag{}'.format(i) for i in range(count)) if name not in existing]
+        tags = [Tag(pk=start + i, name=name, created_at=now) for i, name in enumerate(names)]
+        Tag.objects.bulk_create(tags)
+        return tags
+
+    def create_articles(self, count, comments_per_article, categories):
+        now = timezone.now()
+        article_pk = self.next_pk(Article)
+        comment_pk = self.next_pk(Comment)
+        articles, comments = [], []
+        for i in range(count):
+            created_at = now - timedelta(minutes=(count - i) * 10)
+            article = Article(
+                pk=article_pk + i,
+                title=self.sentence(3, 8).capitalize()[:200],
+                text=self.sentence(40, 200)[:3000],
+                author='author{}'.format(self.rng.randint(1, max(count // 20, 1))),
+                created_at=created_at, updated_at=created_at,
+                category=self.rng.choice(categories) if categories and self.rng.random() < 0.8 else None,
+                comments_count=comments_per_article,
+            )
+            for j in range(comments_per_article):
+                comment_at = created_at + timedelta(seconds=(j + 1) * 30)
+                comments.append(Comment(
+                    pk=comment_pk, article_id=article.pk, text=self.sentence(5, 40)[:400],
+                    author='reader{}'.format(self.rng.randint(1, 500)),
+                    created_at=comment_at, updated_at=comment_at,
+                ))
+                comment_pk += 1
+                article.last_comment_at = comment_at
+            articles.append(article)
+            if len(articles) >= self.batch_size or len(comments) >= self.batch_size:
+                self.flush(articles, comments)
+                articles, comments = [], []
+        self.flush(articles, comments)
+        return range(article_pk, article_pk + count)
+
+    def flush(self, articles, comments):
+        Article.objects.bulk_create(articles)
+        Comment.objects.bulk_create(comments)
+
+    def tag_articles(self, article_ids, tags, per_article, exponent):
+        if not tags or not per_article:
+            return
+        cum_weights = list(accumulate(1 / rank ** exponent for rank in range(1, len(tags) + 1)))
+        per_article = min(per_article, len(tags))
+        Through = Article.tags.through
+        rows = []
+        for article_id in article_ids:
+            chosen = set()
+            for _ in range(per_article * 4):
+                chosen.add(self.rng.choices(tags, cum_weights=cum_weights)[0].pk)
+                if len(chosen) == per_article:
+                    break
+            rows.extend(Through(article_id=article_id, tag_id=tag_id) for tag_id in chosen)
+            if len(rows) >= self.batch_size:
+                Through.objects.bulk_create(rows)
+                rows = []
+        Through.objects.bulk_create(rows)
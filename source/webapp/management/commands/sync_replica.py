@@ -0,0 +1,35 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Copies the primary SQLite database over the SQLite replicas in DATABASE_REPLICAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep syncing every N seconds instead of once')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured, set BLOG_REPLICA=1 to add the local one')
+        aliases = ['default'] + list(settings.DATABASE_REPLICAS)
+        for alias in aliases:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError('{} is not an SQLite database'.format(alias))
+        while True:
+            start = time.perf_counter()
+            self.sync(aliases[0], aliases[1:])
+            self.stdout.write('Synced {} in {:.3f}s'.format(', '.join(aliases[1:]), time.perf_counter() - start))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, primary, replicas):
+        with sqlite3.connect(connections[primary].settings_dict['NAME']) as source:
+            for alias in replicas:
+                with sqlite3.connect(connections[alias].settings_dict['NAME']) as target:
+                    source.backup(target)
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from webapp.warmup import warm_templates, warm_urls
+
+
+class Command(BaseCommand):
+    help = ('Compiles every template and the URLconf, failing on the first error. main.wsgi runs the '
+            'same warm-up in each worker when WARM_UP_ON_START is set, the cached loader keeps the result')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        warm_urls()
+        urls = time.perf_counter() - start
+        names = warm_templates()
+        templates = time.perf_counter() - start - urls
+        if options['verbosity'] > 1:
+            for name in names:
+                self.stdout.write(name)
+        self.stdout.write(self.style.SUCCESS('URLconf in {:.1f} ms, {} templates in {:.1f} ms'.format(
+            urls * 1000, len(names), templates * 1000)))
@@ -0,0 +1,39 @@
+from django.db import OperationalError, migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS webapp_article_fts "
+            "USING fts5(title, text, tags, comments, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5: searches fall back to icontains
+        return
+    schema_editor.execute(
+        "INSERT INTO webapp_article_fts (rowid, title, text, tags, comments) "
+        "SELECT a.id, a.title, a.text, "
+        "COALESCE((SELECT group_concat(t.name, ' ') FROM webapp_article_tags at "
+        "JOIN webapp_tag t ON t.id = at.tag_id WHERE at.article_id = a.id), ''), "
+        "COALESCE((SELECT group_concat(c.text, char(10)) FROM webapp_comment c WHERE c.article_id = a.id), '') "
+        "FROM webapp_article a"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS webapp_article_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0006_article_tags'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+def normalize(name):
+    return ' '.join(name.split()).lower()[:31]
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    Tag = apps.get_model('webapp', 'Tag')
+    Through = apps.get_model('webapp', 'Article').tags.through
+    keepers = {}
+    for tag in Tag.objects.order_by('pk'):
+        name = normalize(tag.name)
+        if not name:
+            tag.delete()
+        elif name in keepers:
+            keeper = keepers[name]
+            tagged = set(Through.objects.filter(tag_id=keeper).values_list('article_id', flat=True))
+            Through.objects.filter(tag_id=tag.pk).exclude(article_id__in=tagged).update(tag_id=keeper)
+            tag.delete()
+        else:
+            keepers[name] = tag.pk
+            if tag.name != name:
+                tag.name = name
+                tag.save(update_fields=['name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0007_article_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='name',
+            field=models.CharField(max_length=31, unique=True, verbose_name='Тег'),
+        ),
+    ]
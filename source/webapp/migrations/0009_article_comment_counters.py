@@ -0,0 +1,37 @@
+# Generated by Django 2.2 on 2026-10-18 17:45
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_comment_counters(apps, schema_editor):
+    Article = apps.get_model('webapp', 'Article')
+    Comment = apps.get_model('webapp', 'Comment')
+    comments = Comment.objects.filter(article=OuterRef('pk')).order_by().values('article')
+    Article.objects.update(
+        comments_count=Coalesce(Subquery(comments.annotate(total=Count('pk')).values('total'),
+                                         output_field=IntegerField()), 0),
+        last_comment_at=Subquery(comments.annotate(last=Max('updated_at')).values('last')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0008_tag_name_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Последний комментарий'),
+        ),
+        migrations.RunPython(fill_comment_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 2.2 on 2026-10-18 17:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# author__iexact compiles to LIKE, which SQLite only serves from an index
+# built with the NOCASE collation. Django 2.2 cannot declare one.
+NOCASE_INDEXES = [
+    ('webapp_article_author_nocase', 'webapp_article'),
+    ('webapp_comment_author_nocase', 'webapp_comment'),
+]
+
+
+def create_nocase_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name, table in NOCASE_INDEXES:
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS {} ON {} (author COLLATE NOCASE)'.format(name, table))
+
+
+def drop_nocase_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name, table in NOCASE_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(name))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0009_article_comment_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='article',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='webapp.Article', verbose_name='Статья'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['-created_at', '-id'], name='webapp_article_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['article', '-created_at', '-id'], name='webapp_comment_article_idx'),
+        ),
+        migrations.RunPython(create_nocase_indexes, drop_nocase_indexes),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2 on 2026-10-18 18:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0011_related_article'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularArticle',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(unique=True, verbose_name='Место')),
+                ('views', models.PositiveIntegerField(verbose_name='Просмотры')),
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='webapp.Article', verbose_name='Статья')),
+            ],
+            options={
+                'ordering': ['rank'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArticleViewCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(verbose_name='Час')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотры')),
+                ('article', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='view_counts', to='webapp.Article', verbose_name='Статья')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='articleviewcount',
+            index=models.Index(fields=['bucket', 'article', 'views'], name='webapp_viewcount_bucket_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='articleviewcount',
+            unique_together={('article', 'bucket')},
+        ),
+    ]
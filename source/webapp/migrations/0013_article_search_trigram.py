@@ -0,0 +1,49 @@
+from django.db import OperationalError, migrations
+
+
+def create_index(schema_editor, tokenize, tag_name):
+    schema_editor.execute('DROP TABLE IF EXISTS webapp_article_fts')
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE webapp_article_fts "
+            "USING fts5(title, text, tags, comments, tokenize = '{}')".format(tokenize)
+        )
+    except OperationalError:
+        # SQLite built without FTS5: searches fall back to icontains
+        return
+    schema_editor.execute(
+        "INSERT INTO webapp_article_fts (rowid, title, text, tags, comments) "
+        "SELECT a.id, a.title, a.text, "
+        "COALESCE((SELECT group_concat({}, ' ') FROM webapp_article_tags at "
+        "JOIN webapp_tag t ON t.id = at.tag_id WHERE at.article_id = a.id), ''), "
+        "COALESCE((SELECT group_concat(c.text, char(10)) FROM webapp_comment c WHERE c.article_id = a.id), '') "
+        "FROM webapp_article a".format(tag_name)
+    )
+
+
+def use_trigrams(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    if schema_editor.connection.Database.sqlite_version_info < (3, 34, 0):
+        # no trigram tokenizer: searches fall back to icontains
+        schema_editor.execute('DROP TABLE IF EXISTS webapp_article_fts')
+        return
+    # tag names between unit separators, see webapp.search.TAG_SEPARATOR
+    create_index(schema_editor, 'trigram', "char(31) || t.name || char(31)")
+
+
+def use_words(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    create_index(schema_editor, 'unicode61 remove_diacritics 2', 't.name')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0012_article_view_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(use_trigrams, use_words),
+    ]
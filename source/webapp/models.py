@@ -11,6 +11,14 @@ class Article(models.Model):
     category = models.ForeignKey('webapp.Category', on_delete=models.PROTECT, null=True, blank=True,
                                  verbose_name='Категория ',  related_name='articles')
     tags = models.ManyToManyField('webapp.Tag', related_name='articles', verbose_name='Теги', blank=True)
+    comments_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев')
+    last_comment_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                           verbose_name='Последний комментарий')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='webapp_article_created_idx'),
+        ]
 
     def __str__(self):
         return "{}. {}".format(self.pk, self.title)
@@ -19,17 +27,71 @@ class Article(models.Model):
 
 
 class Comment(models.Model):
+    # indexed by webapp_comment_article_idx, which starts with article_id
     article = models.ForeignKey('webapp.Article', related_name='comments', on_delete=models.CASCADE,
-                                verbose_name='Статья')
+                                db_index=False, verbose_name='Статья')
     text = models.TextField(max_length=400, verbose_name='Комментарий')
     author = models.CharField(max_length=40, null=True, blank=True, default='Аноним', verbose_name='Автор')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Время создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Время изменения')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['article', '-created_at', '-id'], name='webapp_comment_article_idx'),
+        ]
+
     def __str__(self):
         return self.text[:20]
 
 
+class RelatedArticle(models.Model):
+    # indexed by the unique (article, rank) pair, which starts with article_id
+    article = models.ForeignKey('webapp.Article', related_name='related_links', on_delete=models.CASCADE,
+                                db_index=False, verbose_name='Статья')
+    related = models.ForeignKey('webapp.Article', related_name='+', on_delete=models.CASCADE,
+                                verbose_name='Похожая статья')
+    rank = models.PositiveSmallIntegerField(verbose_name='Место')
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        unique_together = ['article', 'rank']
+        ordering = ['article', 'rank']
+
+    def __str__(self):
+        return '{} -> {}'.format(self.article_id, self.related_id)
+
+
+class ArticleViewCount(models.Model):
+    """Views of an article in the hour starting at bucket, written by webapp.viewcounts."""
+    # indexed by the unique (article, bucket) pair, which starts with article_id
+    article = models.ForeignKey('webapp.Article', related_name='view_counts', on_delete=models.CASCADE,
+                                db_index=False, verbose_name='Статья')
+    bucket = models.DateTimeField(verbose_name='Час')
+    views = models.PositiveIntegerField(default=0, verbose_name='Просмотры')
+
+    class Meta:
+        unique_together = ['article', 'bucket']
+        indexes = [
+            models.Index(fields=['bucket', 'article', 'views'], name='webapp_viewcount_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return '{} {}: {}'.format(self.article_id, self.bucket, self.views)
+
+
+class PopularArticle(models.Model):
+    article = models.OneToOneField('webapp.Article', related_name='+', on_delete=models.CASCADE,
+                                   verbose_name='Статья')
+    rank = models.PositiveSmallIntegerField(unique=True, verbose_name='Место')
+    views = models.PositiveIntegerField(verbose_name='Просмотры')
+
+    class Meta:
+        ordering = ['rank']
+
+    def __str__(self):
+        return '{}. {}'.format(self.rank, self.article_id)
+
+
 class Category(models.Model):
     name = models.CharField(max_length=20, verbose_name='Название')
 
@@ -38,10 +100,21 @@ class Category(models.Model):
 
 
 class Tag(models.Model):
-    name = models.CharField(max_length=31, verbose_name='Тег')
+    name = models.CharField(max_length=31, unique=True, verbose_name='Тег')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Время создания')
 
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def normalize_name(name):
+        return ' '.join(name.split()).lower()[:31]
+
+    def clean(self):
+        self.name = self.normalize_name(self.name)
+
+    def save(self, *args, **kwargs):
+        self.name = self.normalize_name(self.name)
+        super().save(*args, **kwargs)
+
 #
\ No newline at end of file
@@ -0,0 +1,130 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from webapp.cache import PAGE_SCOPE, get_cache, get_listing_generation, get_versions, is_shared
+from webapp.compression import split_tokens
+from webapp.routers import PIN_COOKIE
+from webapp.writebehind import PENDING_COOKIE
+
+
+def article_page_version(request, pk):
+    return get_versions(PAGE_SCOPE, [pk])[pk]
+
+
+def index_page_version(request):
+    return get_listing_generation()
+
+
+def is_enabled():
+    options = settings.PAGE_CACHE
+    return options['ENABLED'] and (options['SINGLE_PROCESS'] or is_shared())
+
+
+def is_cacheable(request):
+    # a session may belong to a logged in user, the other cookies ask for
+    # the freshest data this worker can read
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    return not any(name in request.COOKIES for name in (settings.SESSION_COOKIE_NAME, PENDING_COOKIE, PIN_COOKIE))
+
+
+class PageCache:
+    """
+    Whole pages for anonymous readers. An entry is stored under the path
+    and query string together with the version it was rendered for, so
+    an outdated entry stays readable as a stale copy. One request at a
+    time rebuilds a page, holding a lock taken with cache.add(); the
+    others get the stale copy, or wait for the rebuilt page when there is
+    none. CSRF tokens are cut out of the stored body and every response
+    gets its own.
+    """
+
+    def __init__(self, options):
+        self.timeout = options['TIMEOUT']
+        self.lock_timeout = options['LOCK_TIMEOUT']
+        self.wait = options['WAIT']
+        self.poll_interval = options['POLL_INTERVAL']
+        self.counters = {'hits': 0, 'stale': 0, 'misses': 0, 'waits': 0}
+        self._lock = threading.Lock()
+
+    def key(self, scope, request):
+        query = sorted(request.GET.lists())
+        return 'page:{}:{}'.format(scope, hashlib.md5('{}?{}'.format(request.path, query).encode()).hexdigest())
+
+    def serve(self, request, key, version, render):
+        cache = get_cache()
+        entry = cache.get(key)
+        if entry is not None and entry['version'] == version:
+            self.count('hits')
+            return self.response(request, entry)
+
+        lock = key + ':lock'
+        if cache.add(lock, version, self.lock_timeout):
+            self.count('misses')
+            try:
+                return self.render(render, key, version)
+            finally:
+                cache.delete(lock)
+        if entry is not None:
+            self.count('stale')
+            return self.response(request, entry)
+
+        self.count('waits')
+        deadline = time.monotonic() + self.wait
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            entry = cache.get(key)
+            if entry is not None and entry['version'] == version:
+                return self.response(request, entry)
+            if cache.get(lock) is None:
+                break
+        # the page turned out not to be cacheable, or its rebuild is slow
+        return render()
+
+    def render(self, render, key, version):
+        response = render()
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+        if response.status_code == 200 and not response.streaming:
+            get_cache().set(key, {
+                'version': version,
+                'parts': split_tokens(response.content)[0],
+                'content_type': response['Content-Type'],
+            }, self.timeout)
+        return response
+
+    def response(self, request, entry):
+        parts = entry['parts']
+        content = get_token(request).encode().join(parts) if len(parts) > 1 else parts[0]
+        return HttpResponse(content, content_type=entry['content_type'])
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+page_cache = PageCache(settings.PAGE_CACHE)
+
+
+def cache_anonymous_page(scope, version_func):
+    """Serve the view to anonymous GETs from page_cache, versioned by version_func(request, *args, **kwargs)."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_enabled() or not is_cacheable(request):
+                return view(request, *args, **kwargs)
+            key = page_cache.key(scope, request)
+            version = version_func(request, *args, **kwargs)
+            return page_cache.serve(request, key, version, lambda: view(request, *args, **kwargs))
+        return wrapper
+    return decorator
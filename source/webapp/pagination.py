@@ -0,0 +1,146 @@
+import base64
+import json
+
+from django.core.paginator import Paginator
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+class CountedPaginator(Paginator):
+    """Paginator that trusts a count stored elsewhere instead of running COUNT(*)."""
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, count=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.known_count = count
+
+    @cached_property
+    def count(self):
+        if self.known_count is None:
+            return super().count
+        return self.known_count
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Paginator for admin changelists that never counts a whole table: an
+    unfiltered table is estimated from its largest primary key and a
+    filtered one is counted up to max_count rows.
+    """
+    max_count = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return queryset.aggregate(last=Max('pk'))['last'] or 0
+        return queryset[:self.max_count].count()
+
+
+class CursorPage:
+    cursor_based = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset paginator: pages are selected with a WHERE on the ordering
+    columns of the last row seen instead of COUNT(*) and OFFSET, so every
+    page costs one query regardless of its depth.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id')):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = ordering
+        self.fields = [field.lstrip('-') for field in ordering]
+
+    def _value(self, obj, field):
+        if isinstance(obj, dict):
+            return obj[field]
+        return getattr(obj, field)
+
+    def encode_cursor(self, obj, direction):
+        values = []
+        for field in self.fields:
+            value = self._value(obj, field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        data = json.dumps([direction, values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        # a cursor comes from the client: anything malformed reads the first page
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(data.decode())
+            if direction not in ('next', 'prev') or not isinstance(values, list) or len(values) != len(self.fields):
+                return None, None
+            if any(isinstance(value, bool) or not isinstance(value, (str, int)) for value in values):
+                return None, None
+            values = [parse_datetime(value) or value if isinstance(value, str) else value for value in values]
+        except (TypeError, ValueError, UnicodeDecodeError):
+            return None, None
+        return direction, values
+
+    def _seek(self, values, backwards, start=0):
+        # (a, b) < (x, y) written as a <= x AND (a < x OR b < y): the
+        # leading range lets SQLite walk the ordering index and stop at
+        # LIMIT, a plain OR of the cases would sort every older row
+        descending = self.ordering[start].startswith('-') != backwards
+        field, value = self.fields[start], values[start]
+        strict = Q(**{'{}__{}'.format(field, 'lt' if descending else 'gt'): value})
+        if start == len(self.fields) - 1:
+            return strict
+        loose = Q(**{'{}__{}'.format(field, 'lte' if descending else 'gte'): value})
+        return loose & (strict | self._seek(values, backwards, start + 1))
+
+    def _reversed_ordering(self):
+        return [field[1:] if field.startswith('-') else '-' + field for field in self.ordering]
+
+    def get_queryset(self, cursor=None):
+        """The rows after (or, for a 'prev' cursor, before) cursor, in the order they are read."""
+        direction, values = self.decode_cursor(cursor) if cursor else (None, None)
+        if direction == 'prev':
+            return self.queryset.filter(self._seek(values, True)).order_by(*self._reversed_ordering())
+        queryset = self.queryset
+        if direction == 'next':
+            queryset = queryset.filter(self._seek(values, False))
+        return queryset.order_by(*self.ordering)
+
+    def get_page(self, cursor=None):
+        direction, values = self.decode_cursor(cursor) if cursor else (None, None)
+        rows = list(self.get_queryset(cursor)[:self.per_page + 1])
+        if direction == 'prev':
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = True
+        else:
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = direction == 'next'
+        if not rows:
+            return CursorPage(rows)
+        return CursorPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], 'next') if has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], 'prev') if has_previous else None,
+        )
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+class RingBuffer:
+    def __init__(self, size):
+        self._items = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def append(self, item):
+        with self._lock:
+            self._items.append(item)
+
+    def items(self):
+        with self._lock:
+            return list(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+slow_requests = RingBuffer(settings.PROFILING['BUFFER_SIZE'])
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - start, sql))
+
+    @property
+    def duration(self):
+        return sum(duration for duration, sql in self.queries)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view_start = None
+        self.view_end = None
+        self.template = 0.0
+        self.queries = QueryRecorder()
+
+    def template_rendered(self, response):
+        self.template = time.perf_counter() - self.view_end
+        return response
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+class ProfilingMiddleware:
+    """
+    Splits every request into SQL, view and template time, sends them as
+    a Server-Timing header and keeps the slowest requests with their top
+    queries in a ring buffer. Not loaded at all unless PROFILING['ENABLED'].
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = settings.PROFILING['SLOW_REQUEST_MS']
+        self.top_queries = settings.PROFILING['TOP_QUERIES']
+
+    def __call__(self, request):
+        profile = request._profile = RequestProfile()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile.queries))
+            response = self.get_response(request)
+        end = time.perf_counter()
+        total = end - profile.start
+        view = (profile.view_end or end) - (profile.view_start or profile.start)
+        db = profile.queries.duration
+
+        response['Server-Timing'] = ', '.join([
+            'db;dur={};desc="{} queries"'.format(_ms(db), len(profile.queries.queries)),
+            'view;dur={}'.format(_ms(view)),
+            'tpl;dur={}'.format(_ms(profile.template)),
+            'total;dur={}'.format(_ms(total)),
+        ])
+        if total * 1000 >= self.slow_ms:
+            match = getattr(request, 'resolver_match', None)
+            top = sorted(profile.queries.queries, key=lambda query: query[0], reverse=True)[:self.top_queries]
+            slow_requests.append({
+                'at': time.time(),
+                'method': request.method,
+                'path': request.get_full_path(),
+                'url_name': match.url_name if match else None,
+                'status': response.status_code,
+                'total_ms': _ms(total),
+                'view_ms': _ms(view),
+                'template_ms': _ms(profile.template),
+                'db_ms': _ms(db),
+                'queries': len(profile.queries.queries),
+                'top_queries': [{'ms': _ms(duration), 'sql': sql} for duration, sql in top],
+            })
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._profile.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        profile = request._profile
+        profile.view_end = time.perf_counter()
+        response.add_post_render_callback(profile.template_rendered)
+        return response
@@ -0,0 +1,75 @@
+import logging
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+logger = logging.getLogger(__name__)
+
+# url name -> {'last': int, 'max': int, 'requests': int}
+query_counts = {}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def get_budget(url_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
+
+
+def record(url_name, count):
+    stats = query_counts.setdefault(url_name, {'last': 0, 'max': 0, 'requests': 0})
+    stats['last'] = count
+    stats['max'] = max(stats['max'], count)
+    stats['requests'] += 1
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None or not match.url_name:
+            return response
+        record(match.url_name, counter.count)
+        budget = get_budget(match.url_name)
+        if budget is not None and counter.count > budget:
+            message = '{} ran {} queries, budget is {}'.format(match.url_name, counter.count, budget)
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class QueryBudgetTestMixin:
+    @contextmanager
+    def assertQueryBudget(self, url_name, using='default'):
+        budget = get_budget(url_name)
+        if budget is None:
+            self.fail('No query budget declared for {}'.format(url_name))
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertLessEqual(
+            len(context), budget,
+            '{} ran {} queries, budget is {}:\n{}'.format(url_name, len(context), budget, queries)
+        )
@@ -0,0 +1,26 @@
+import re
+
+from django.db import connections, router
+
+
+# SQLite reports a full table scan as "SCAN <table>" with no index after it
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(?P<table>\w+)(?: AS \w+)?$')
+
+
+def explain(queryset):
+    """EXPLAIN QUERY PLAN lines of a queryset on the database it reads from."""
+    using = queryset.db or router.db_for_read(queryset.model)
+    sql, params = queryset.query.sql_with_params()
+    with connections[using].cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanTestMixin:
+    def assertNoFullScan(self, queryset, msg=None):
+        plan = explain(queryset)
+        scans = [detail for detail in plan if FULL_SCAN.match(detail)]
+        if scans:
+            self.fail(msg or 'Full table scan of {}:\n{}\n{}'.format(
+                ', '.join(FULL_SCAN.match(detail).group('table') for detail in scans),
+                queryset.query, '\n'.join(plan)))
@@ -0,0 +1,162 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from webapp.cache import bump_article_pages
+from webapp.models import Article, RelatedArticle
+
+
+Through = Article.tags.through
+
+
+def cosine(overlap, size_a, size_b):
+    return overlap / math.sqrt(size_a * size_b)
+
+
+def jaccard(overlap, size_a, size_b):
+    return overlap / (size_a + size_b - overlap)
+
+
+METRICS = {
+    'cosine': cosine,
+    'jaccard': jaccard,
+}
+
+
+class TagMatrix:
+    """
+    The sparse article x tag matrix, held both as the tags of every article
+    (rows) and as the articles of every tag (columns, an inverted index).
+    The overlaps of one article with all others are the sum of its tags'
+    columns, so a neighbour search touches only the nonzeros it shares.
+
+    Tags on more than max_column articles say little about similarity and
+    would make every search scan them. They do not propose candidates, but
+    still count towards the overlap of the candidates found through other
+    tags. sizes is the tag count of every article when rows only hold part
+    of the matrix.
+    """
+
+    def __init__(self, pairs, sizes=None, max_column=None):
+        self.rows = defaultdict(list)
+        self.columns = defaultdict(list)
+        for article_id, tag_id in pairs:
+            self.rows[article_id].append(tag_id)
+            self.columns[tag_id].append(article_id)
+        self.sizes = sizes if sizes is not None else {pk: len(tags) for pk, tags in self.rows.items()}
+        self.max_column = max_column or settings.RELATED_ARTICLES['MAX_TAG_ARTICLES']
+        self._by_size = {}
+
+    def by_size(self, tag_id):
+        # the column with its smallest articles, then the newest, first
+        if tag_id not in self._by_size:
+            self._by_size[tag_id] = sorted(self.columns[tag_id], key=lambda pk: (self.sizes[pk], -pk))
+        return self._by_size[tag_id]
+
+    def neighbours(self, article_id, count, metric='cosine'):
+        tags = self.rows.get(article_id)
+        if not tags:
+            return []
+        tags = sorted(tags, key=lambda tag_id: len(self.columns[tag_id]))
+        rare = [tag_id for tag_id in tags if len(self.columns[tag_id]) <= self.max_column] or tags[:1]
+        overlaps = Counter()
+        for tag_id in rare:
+            overlaps.update(self.columns[tag_id])
+        overlaps.pop(article_id, None)
+        for tag_id in tags[len(rare):]:
+            members = set(self.columns[tag_id])
+            for pk in overlaps:
+                if pk in members:
+                    overlaps[pk] += 1
+
+        # most candidates share a single tag, and among those the ones with
+        # the fewest tags score best: only the head of each column sorted by
+        # size has to be scored next to the candidates sharing more
+        candidates = []
+        for pk, overlap in overlaps.most_common():
+            if overlap < 2:
+                break
+            candidates.append(pk)
+        for tag_id in rare:
+            taken = 0
+            for pk in self.by_size(tag_id):
+                if taken == count:
+                    break
+                if overlaps.get(pk) == 1:
+                    candidates.append(pk)
+                    taken += 1
+
+        score = METRICS[metric]
+        size = self.sizes[article_id]
+        # ties go to the newer article
+        top = heapq.nlargest(count, {(score(overlaps[pk], size, self.sizes[pk]), pk) for pk in candidates})
+        return [(pk, value) for value, pk in top]
+
+
+def load_matrix(article_ids):
+    """The columns of every tag of article_ids, enough to search their neighbours."""
+    tag_ids = Through.objects.filter(article_id__in=article_ids).values('tag_id')
+    pairs = Through.objects.filter(tag_id__in=tag_ids).values_list('article_id', 'tag_id')
+    in_columns = Through.objects.filter(tag_id__in=tag_ids).values('article_id')
+    sizes = Through.objects.filter(article_id__in=in_columns).order_by()\
+        .values('article_id').annotate(tags=Count('tag_id')).values_list('article_id', 'tags')
+    return TagMatrix(pairs.iterator(), dict(sizes))
+
+
+def links(article_id, neighbours):
+    return [RelatedArticle(article_id=article_id, related_id=pk, rank=rank, score=score)
+            for rank, (pk, score) in enumerate(neighbours)]
+
+
+def rebuild(count=None, metric=None, batch_size=1000):
+    """Replace every related list, in one transaction. Returns the number of rows written."""
+    count = count or settings.RELATED_ARTICLES['COUNT']
+    metric = metric or settings.RELATED_ARTICLES['METRIC']
+    matrix = TagMatrix(Through.objects.values_list('article_id', 'tag_id').iterator())
+    written = 0
+    with transaction.atomic():
+        RelatedArticle.objects.all().delete()
+        batch = []
+        for article_id in matrix.rows:
+            batch.extend(links(article_id, matrix.neighbours(article_id, count, metric)))
+            if len(batch) >= batch_size:
+                RelatedArticle.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        RelatedArticle.objects.bulk_create(batch)
+        written += len(batch)
+    bump_article_pages(list(matrix.rows))
+    return written
+
+
+def update_related(article_ids):
+    """
+    Recompute the lists of articles whose tags changed, of the articles
+    that list them, and of their new neighbours, where they may now belong.
+    Any other list catches up on the next rebuild.
+    """
+    article_ids = set(article_ids)
+    if not article_ids:
+        return
+    count, metric = settings.RELATED_ARTICLES['COUNT'], settings.RELATED_ARTICLES['METRIC']
+    affected = set(article_ids)
+    matrix = load_matrix(article_ids)
+    for article_id in article_ids:
+        affected.update(pk for pk, score in matrix.neighbours(article_id, count, metric))
+    affected.update(RelatedArticle.objects.filter(related_id__in=article_ids).values_list('article_id', flat=True))
+    matrix = load_matrix(affected)
+    with transaction.atomic():
+        RelatedArticle.objects.filter(article_id__in=affected).delete()
+        RelatedArticle.objects.bulk_create([
+            link for article_id in affected for link in links(article_id, matrix.neighbours(article_id, count, metric))
+        ])
+    bump_article_pages(affected)
+
+
+def schedule_update(article_ids):
+    article_ids = list(article_ids)
+    transaction.on_commit(lambda: update_related(article_ids))
@@ -0,0 +1,78 @@
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_state = threading.local()
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends writes to 'default' and reads to one of DATABASE_REPLICAS, but
+    only while ReplicaPinningMiddleware allows it for the current request.
+    Management commands, background threads and writing requests always
+    read from the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if replicas and getattr(_state, 'use_replicas', False):
+            alias = random.choice(replicas)
+            # a test mirror points at the primary's database through another
+            # connection that cannot see the test's transaction
+            if connections[alias].settings_dict['NAME'] != connections['default'].settings_dict['NAME']:
+                return alias
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPinningMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned_until = request.COOKIES.get(PIN_COOKIE, '')
+        try:
+            pinned = float(pinned_until) > time.time()
+        except ValueError:
+            pinned = False
+        _state.use_replicas = request.method in SAFE_METHODS and not pinned
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.use_replicas = False
+        if request.method not in SAFE_METHODS or getattr(request, 'pin_primary', False):
+            # the client reads its own writes from the primary until the
+            # replicas have had time to catch up
+            window = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(PIN_COOKIE, str(time.time() + window), max_age=window)
+        return response
+
+
+def primary_only(view):
+    """For views that write on a safe method: read from the primary and pin the client."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.pin_primary = True
+        use_replicas = getattr(_state, 'use_replicas', False)
+        _state.use_replicas = False
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.use_replicas = use_replicas
+    return wrapper
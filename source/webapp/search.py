@@ -0,0 +1,150 @@
+from django.db import connections, router
+
+from webapp.models import Article, Comment
+
+
+FTS_TABLE = 'webapp_article_fts'
+
+# FullSearchForm checkbox -> FTS5 column
+SEARCH_COLUMNS = {
+    'in_title': 'title',
+    'in_text': 'text',
+    'in_tags': 'tags',
+    'in_comment_text': 'comments',
+}
+
+# the trigram tokenizer only matches substrings of three characters or more
+MIN_LENGTH = 3
+
+# tag names are stored between separators, so a phrase with them around
+# matches a whole name only
+TAG_SEPARATOR = '\x1f'
+
+_available = {}
+
+
+def is_available(using=None):
+    using = using or router.db_for_read(Article)
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    key = (using, connection.settings_dict['NAME'])
+    if key not in _available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _available[key] = cursor.fetchone() is not None
+    return _available[key]
+
+
+def can_match(terms):
+    return bool(terms) and all(len(term) >= MIN_LENGTH for term in terms)
+
+
+def _phrase(text):
+    return '"{}"'.format(text.replace('"', '""'))
+
+
+def build_match(terms, columns):
+    """
+    Every term as a case-insensitive substring of one of columns, like
+    icontains, except 'tags', where it has to be a whole tag name, like
+    the iexact lookup on Tag.name.
+    """
+    if not can_match(terms) or not columns:
+        return None
+    substring_columns = [column for column in columns if column != 'tags']
+    clauses = []
+    for term in terms:
+        alternatives = []
+        if substring_columns:
+            alternatives.append('{{{}}}: {}'.format(' '.join(substring_columns), _phrase(term)))
+        if 'tags' in columns:
+            alternatives.append('tags: {}'.format(_phrase(TAG_SEPARATOR + term + TAG_SEPARATOR)))
+        clauses.append('({})'.format(' OR '.join(alternatives)))
+    return ' AND '.join(clauses)
+
+
+def search_article_ids(terms, columns, limit=None, using=None):
+    match = build_match(terms, columns)
+    if match is None:
+        return []
+    using = using or router.db_for_read(Article)
+    sql = 'SELECT rowid FROM {} WHERE {} MATCH %s ORDER BY rank'.format(FTS_TABLE, FTS_TABLE)
+    params = [match]
+    if limit:
+        sql += ' LIMIT %s'
+        params.append(limit)
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def iter_article_ids(terms, columns, chunk_size=1000, using=None):
+    """All matching ids in rank order, fetched chunk_size at a time."""
+    match = build_match(terms, columns)
+    if match is None:
+        return
+    using = using or router.db_for_read(Article)
+    sql = 'SELECT rowid FROM {} WHERE {} MATCH %s ORDER BY rank'.format(FTS_TABLE, FTS_TABLE)
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, [match])
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [row[0] for row in rows]
+
+
+def _documents(article_ids, using):
+    articles = Article.objects.using(using).filter(pk__in=article_ids).values_list('pk', 'title', 'text')
+    documents = {pk: [title, text, [], []] for pk, title, text in articles}
+    through = Article.tags.through.objects.using(using).filter(article_id__in=documents)
+    for article_id, name in through.values_list('article_id', 'tag__name'):
+        documents[article_id][2].append(name)
+    comments = Comment.objects.using(using).filter(article_id__in=documents)
+    for article_id, text in comments.values_list('article_id', 'text'):
+        documents[article_id][3].append(text)
+    for pk, (title, text, tags, comments) in documents.items():
+        yield pk, title, text, ' '.join(TAG_SEPARATOR + name + TAG_SEPARATOR for name in tags), '\n'.join(comments)
+
+
+def index_articles(article_ids, using=None):
+    article_ids = [pk for pk in set(article_ids) if pk is not None]
+    using = using or router.db_for_write(Article)
+    if not article_ids or not is_available(using):
+        return
+    remove_articles(article_ids, using=using)
+    rows = list(_documents(article_ids, using))
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO {} (rowid, title, text, tags, comments) VALUES (%s, %s, %s, %s, %s)'.format(FTS_TABLE),
+            rows
+        )
+
+
+def remove_articles(article_ids, using=None):
+    using = using or router.db_for_write(Article)
+    if not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany('DELETE FROM {} WHERE rowid = %s'.format(FTS_TABLE), [[pk] for pk in article_ids])
+
+
+def rebuild_index(batch_size=500, using=None):
+    using = using or router.db_for_write(Article)
+    with connections[using].cursor() as cursor:
+        cursor.execute('DELETE FROM {}'.format(FTS_TABLE))
+    ids = Article.objects.using(using).order_by('pk').values_list('pk', flat=True)
+    batch = []
+    total = 0
+    for pk in ids.iterator():
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            index_articles(batch, using=using)
+            total += len(batch)
+            batch = []
+    index_articles(batch, using=using)
+    total += len(batch)
+    with connections[using].cursor() as cursor:
+        cursor.execute("INSERT INTO {0} ({0}) VALUES ('optimize')".format(FTS_TABLE))
+    return total
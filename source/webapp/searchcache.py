@@ -0,0 +1,64 @@
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from webapp.cache import get_generation
+
+
+def normalize_text(text):
+    # inner whitespace is part of what icontains looks for, only the ends go
+    text = (text or '').strip()
+    # SQLite's LIKE only folds ASCII letters, lower-casing anything else
+    # would change what icontains matches
+    return text.lower() if text.isascii() else text
+
+
+class SearchCache:
+    """
+    Ordered article id lists of search results, keyed by the normalized
+    query and the content generation. Every Article, Comment or Tag write
+    bumps the generation, so a stale list is never looked up again and
+    ages out of the LRU cache on its own.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, kind, **params):
+        normalized = {}
+        for name, value in params.items():
+            if isinstance(value, str):
+                value = normalize_text(value)
+            elif isinstance(value, (list, tuple, set)):
+                value = sorted(normalize_text(item) for item in value)
+            normalized[name] = value
+        digest = hashlib.md5(json.dumps([kind, normalized], sort_keys=True).encode()).hexdigest()
+        return 'search:{}:{}:{}'.format(kind, get_generation(), digest)
+
+    def get_ids(self, key, compute):
+        """Cached ids under key, or compute() stored unless it returns None."""
+        cache = caches[self.alias]
+        ids = cache.get(key)
+        with self._lock:
+            if ids is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if ids is None:
+            ids = compute()
+            if ids is not None:
+                cache.set(key, ids, settings.SEARCH_CACHE_TIMEOUT)
+        return ids
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+search_cache = SearchCache(settings.SEARCH_CACHE_ALIAS)
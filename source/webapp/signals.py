@@ -0,0 +1,174 @@
+import time
+
+from django.db.models.signals import post_save, post_delete, pre_delete, post_init, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from webapp import autocomplete, related, search
+from webapp.cache import bump_versions, bump_generation, bump_article_pages
+from webapp.models import Article, Comment, Category, Tag, RelatedArticle
+from webapp.tags import tag_cache, invalidate_tag_articles
+
+
+def author_changed(instance, created):
+    # __dict__ so a deferred author is not loaded just for this
+    loaded = getattr(instance, '_loaded_author', None)
+    author = instance.__dict__.get('author')
+    if created:
+        autocomplete.authors.add(author)
+    elif author != loaded:
+        autocomplete.authors.add(loaded, -1)
+        autocomplete.authors.add(author)
+    instance._loaded_author = author
+
+
+def touch_articles(article_ids):
+    # the index ETag of a process without a shared cache is read from
+    # updated_at, so changes to the tags and category shown count as edits
+    article_ids = [pk for pk in set(article_ids) if pk is not None]
+    if article_ids:
+        Article.objects.filter(pk__in=article_ids).update(updated_at=timezone.now())
+
+
+@receiver(post_init, sender=Article)
+def article_loaded(sender, instance, **kwargs):
+    instance._loaded_author = instance.__dict__.get('author')
+    # compared with version stamps by FragmentCache
+    instance._loaded_at = time.time()
+
+
+@receiver(post_save, sender=Article)
+def article_saved(sender, instance, created, **kwargs):
+    search.index_articles([instance.pk])
+    bump_versions('article', [instance.pk])
+    bump_article_pages([instance.pk])
+    if not created:
+        # its title is shown on the pages of the articles that list it
+        bump_article_pages(RelatedArticle.objects.filter(related_id=instance.pk).values_list('article_id', flat=True))
+    bump_generation()
+    author_changed(instance, created)
+
+
+@receiver(pre_delete, sender=Article)
+def article_deleting(sender, instance, **kwargs):
+    # the cascade removes its tag links without m2m_changed
+    if autocomplete.tags.index is not None:
+        instance._tag_names = list(instance.tags.values_list('name', flat=True))
+    instance._listed_by = list(RelatedArticle.objects.filter(related_id=instance.pk).values_list('article_id', flat=True))
+
+
+@receiver(post_delete, sender=Article)
+def article_deleted(sender, instance, **kwargs):
+    search.remove_articles([instance.pk])
+    bump_versions('article', [instance.pk])
+    bump_article_pages([instance.pk])
+    bump_generation()
+    autocomplete.authors.add(instance._loaded_author, -1)
+    for name in getattr(instance, '_tag_names', []):
+        autocomplete.tags.add(name, -1)
+    related.schedule_update(getattr(instance, '_listed_by', []))
+
+
+def comments_changed(article_ids):
+    # also called directly by code that writes comments in bulk
+    search.index_articles(article_ids)
+    bump_article_pages(article_ids)
+    # article lists show no comments
+    bump_generation(listing=False)
+
+
+@receiver(post_init, sender=Comment)
+def comment_loaded(sender, instance, **kwargs):
+    instance._loaded_article_id = instance.article_id
+    instance._loaded_author = instance.__dict__.get('author')
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    comments_changed([instance.article_id, instance._loaded_article_id])
+    instance._loaded_article_id = instance.article_id
+    author_changed(instance, created)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    comments_changed([instance.article_id, instance._loaded_article_id])
+    autocomplete.authors.add(instance._loaded_author, -1)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, **kwargs):
+    if created:
+        autocomplete.tags.add(instance.name, 0)
+    else:
+        # a rename: the old name is not known here, reload on next use
+        autocomplete.tags.reset()
+        tag_cache.clear()
+        article_ids = list(instance.articles.values_list('pk', flat=True))
+        touch_articles(article_ids)
+        search.index_articles(article_ids)
+        bump_versions('article', article_ids)
+        bump_article_pages(article_ids)
+        bump_generation()
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, **kwargs):
+    instance._article_ids = list(instance.articles.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    tag_cache.discard(instance.name)
+    autocomplete.tags.remove(instance.name)
+    invalidate_tag_articles([instance.pk])
+    article_ids = getattr(instance, '_article_ids', [])
+    touch_articles(article_ids)
+    search.index_articles(article_ids)
+    bump_versions('article', article_ids)
+    bump_article_pages(article_ids)
+    bump_generation()
+    related.schedule_update(article_ids)
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def article_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        manager = instance.articles if reverse else instance.tags
+        instance._cleared_ids = list(manager.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    related_ids = getattr(instance, '_cleared_ids', []) if action == 'post_clear' else pk_set
+    if reverse:
+        article_ids, tag_ids = related_ids, [instance.pk]
+    else:
+        article_ids, tag_ids = [instance.pk], related_ids
+    touch_articles(article_ids)
+    search.index_articles(article_ids)
+    bump_versions('article', article_ids)
+    bump_article_pages(article_ids)
+    bump_generation()
+    invalidate_tag_articles(tag_ids)
+    related.schedule_update(article_ids)
+    delta = -1 if action in ('post_remove', 'post_clear') else 1
+    if reverse:
+        autocomplete.tags.add(instance.name, delta * len(article_ids))
+    elif autocomplete.tags.index is not None:
+        for name in Tag.objects.filter(pk__in=tag_ids).values_list('name', flat=True):
+            autocomplete.tags.add(name, delta)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    if not created:
+        article_ids = list(instance.articles.values_list('pk', flat=True))
+        touch_articles(article_ids)
+        bump_versions('article', article_ids)
+        bump_article_pages(article_ids)
+        bump_generation()
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    bump_generation()
@@ -0,0 +1,34 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+class Echo:
+    """File-like object for csv.writer that hands every row back instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        values = [row[field] for field in fields]
+        yield writer.writerow([', '.join(value) if isinstance(value, list) else value for value in values])
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def streaming_export(rows, fields, export_format, filename):
+    if export_format == 'csv':
+        response = StreamingHttpResponse(csv_lines(rows, fields), content_type='text/csv; charset=utf-8')
+    else:
+        response = StreamingHttpResponse(ndjson_lines(rows), content_type='application/x-ndjson; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(filename, export_format)
+    return response
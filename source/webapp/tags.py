@@ -0,0 +1,147 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from webapp.cache import get_cache
+from webapp.models import Article, Tag
+
+
+class TagCache:
+    """Bounded LRU mapping of normalized tag name to Tag id."""
+
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, names):
+        found = {}
+        with self._lock:
+            for name in names:
+                if name in self._items:
+                    self._items.move_to_end(name)
+                    found[name] = self._items[name]
+        return found
+
+    def set_many(self, items):
+        with self._lock:
+            for name, pk in items.items():
+                self._items[name] = pk
+                self._items.move_to_end(name)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def discard(self, name):
+        with self._lock:
+            self._items.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+tag_cache = TagCache(settings.TAG_CACHE_SIZE)
+
+
+def parse_tags(value):
+    names = []
+    for name in (value or '').split(','):
+        name = Tag.normalize_name(name)
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def resolve_tags(names):
+    ids = tag_cache.get_many(names)
+    missing = [name for name in names if name not in ids]
+    if missing:
+        found = dict(Tag.objects.filter(name__in=missing).values_list('name', 'pk'))
+        new = [name for name in missing if name not in found]
+        if new:
+            # ignore_conflicts lets a concurrent save create the same tag,
+            # the unique index on name keeps a single row either way.
+            Tag.objects.bulk_create([Tag(name=name) for name in new], ignore_conflicts=True)
+            found.update(Tag.objects.filter(name__in=new).values_list('name', 'pk'))
+        tag_cache.set_many(found)
+        ids.update(found)
+    return [ids[name] for name in names]
+
+
+def set_article_tags(article, value):
+    names = parse_tags(value)
+    try:
+        with transaction.atomic():
+            article.tags.set(resolve_tags(names))
+    except IntegrityError:
+        # A cached id may point to a tag deleted by another process.
+        tag_cache.clear()
+        with transaction.atomic():
+            article.tags.set(resolve_tags(names))
+
+
+def lookup_tags(names):
+    """Ids of the existing tags among names, without creating any."""
+    ids = tag_cache.get_many(names)
+    missing = [name for name in names if name not in ids]
+    if missing:
+        found = dict(Tag.objects.filter(name__in=missing).values_list('name', 'pk'))
+        tag_cache.set_many(found)
+        ids.update(found)
+    return ids
+
+
+TOO_MANY = 'too-many'
+
+
+def _tag_articles_key(tag_id):
+    return 'tag_articles:{}'.format(tag_id)
+
+
+def tag_article_ids(tag_ids):
+    """
+    Map every tag id to a frozenset of its article ids, or to None when the
+    tag is on more than TAG_FILTER_MAX_IDS articles and the database should
+    do the join instead.
+    """
+    cache = get_cache()
+    keys = {_tag_articles_key(pk): pk for pk in tag_ids}
+    # get_many() leaves out None values, big tags are cached as TOO_MANY
+    result = {keys[key]: None if value == TOO_MANY else value
+              for key, value in cache.get_many(list(keys)).items()}
+    missing = [pk for pk in tag_ids if pk not in result]
+    if missing:
+        loaded = {pk: set() for pk in missing}
+        rows = Article.tags.through.objects.filter(tag_id__in=missing).values_list('tag_id', 'article_id')
+        for tag_id, article_id in rows.iterator():
+            loaded[tag_id].add(article_id)
+        loaded = {pk: frozenset(ids) if len(ids) <= settings.TAG_FILTER_MAX_IDS else None
+                  for pk, ids in loaded.items()}
+        cache.set_many({_tag_articles_key(pk): TOO_MANY if ids is None else ids for pk, ids in loaded.items()})
+        result.update(loaded)
+    return result
+
+
+def invalidate_tag_articles(tag_ids):
+    get_cache().delete_many([_tag_articles_key(pk) for pk in tag_ids if pk is not None])
+
+
+def filter_by_tags(queryset, names, match_all=True):
+    ids = lookup_tags(names)
+    if not ids or (match_all and len(ids) < len(names)):
+        return queryset.none()
+    articles = tag_article_ids(list(ids.values()))
+    through = Article.tags.through.objects
+    if not match_all:
+        if any(article_ids is None for article_ids in articles.values()):
+            return queryset.filter(pk__in=through.filter(tag_id__in=list(articles)).values('article_id'))
+        return queryset.filter(pk__in=frozenset().union(*articles.values()))
+    small = [article_ids for article_ids in articles.values() if article_ids is not None]
+    if small:
+        queryset = queryset.filter(pk__in=frozenset.intersection(*small))
+    for tag_id, article_ids in articles.items():
+        if article_ids is None:
+            queryset = queryset.filter(pk__in=through.filter(tag_id=tag_id).values('article_id'))
+    return queryset
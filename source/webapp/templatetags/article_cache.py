@@ -0,0 +1,17 @@
+from django import template
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from webapp.cache import article_fragments
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def article_list(articles):
+    fragments = article_fragments.render_many(
+        list(articles),
+        lambda article: render_to_string('article/pertial/article_item.html', {'article': article})
+    )
+    return mark_safe(''.join(fragments))
@@ -1,3 +1,1211 @@
-from django.test import TestCase
+import base64
+import copy
+import gzip
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError, connections
+from django.db.models import Max, Sum
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.http import HttpResponse
+from django.template import engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.urls import reverse
+from django.utils import timezone
+
+from webapp import autocomplete, benchmarks, compression, related, routers, search, viewcounts, warmup
+from webapp.admin import AuthorFilter
+from webapp.autocomplete import PrefixIndex
+from webapp.cache import FragmentCache, bump_versions, get_cache
+from webapp.forms import FullSearchForm
+from webapp.management.commands import sync_replica
+from webapp.management.commands.import_blog import split_file
+from webapp.models import Article, ArticleViewCount, Comment, Category, PopularArticle, Tag, RelatedArticle
+from webapp.pagecache import page_cache
+from webapp.pagination import CursorPaginator
+from webapp.profiling import RingBuffer, slow_requests
+from webapp.querybudget import QueryBudgetTestMixin, QueryCounter
+from webapp.queryplan import QueryPlanTestMixin
+from webapp.routers import PIN_COOKIE, PrimaryReplicaRouter, ReplicaPinningMiddleware, primary_only
+from webapp.searchcache import search_cache
+from webapp.tags import TagCache, filter_by_tags, parse_tags, resolve_tags, set_article_tags, tag_article_ids, tag_cache
+from webapp.views import ArticleSearchView
+from webapp.writebehind import PENDING_COOKIE, CommentWriteBehind, comment_writer
+
+
+def create_articles(count, comments=2, tags=3):
+    category = Category.objects.create(name='Category')
+    tag_list = [Tag.objects.create(name='tag{}'.format(i)) for i in range(tags)]
+    articles = []
+    for i in range(count):
+        article = Article.objects.create(title='Article number {}'.format(i), text='Text {}'.format(i),
+                                         author='author{}'.format(i % 3), category=category)
+        article.tags.set(tag_list)
+        for j in range(comments):
+            Comment.objects.create(article=article, text='Comment {}'.format(j), author='reader')
+        articles.append(article)
+    return articles
+
+
+class QueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.articles = create_articles(6)
+
+    def test_index(self):
+        with self.assertQueryBudget('index'):
+            self.client.get(reverse('index'))
+        with self.assertQueryBudget('index'):
+            self.client.get(reverse('index'), {'search': 'Article'})
+        with self.assertQueryBudget('index'):
+            self.client.get(reverse('index'), {'tag': ['tag0', 'tag1']})
+
+    def test_article_view(self):
+        with self.assertQueryBudget('article_view'):
+            self.client.get(reverse('article_view', kwargs={'pk': self.articles[0].pk}))
+
+    def test_article_search(self):
+        with self.assertQueryBudget('article_search'):
+            self.client.post(reverse('article_search'), {'text': 'article', 'in_title': 'on'})
+
+    def test_comment_index(self):
+        with self.assertQueryBudget('comment_index'):
+            self.client.get(reverse('comment_index'))
+
+    def test_api(self):
+        with self.assertQueryBudget('api_article_list'):
+            self.client.get(reverse('api_article_list'), {'tag': 'tag0'})
+        with self.assertQueryBudget('api_article_detail'):
+            self.client.get(reverse('api_article_detail', kwargs={'pk': self.articles[0].pk}))
+        with self.assertQueryBudget('api_tag_list'):
+            self.client.get(reverse('api_tag_list'))
+
+    def test_autocomplete(self):
+        for kind, index in autocomplete.KINDS.items():
+            index.reset()
+            index.get_index()
+            with self.assertQueryBudget('autocomplete'):
+                response = self.client.get(reverse('autocomplete'), {'kind': kind, 'q': kind[:2]})
+            self.assertTrue(response.json()['results'])
+
+
+class PerformanceRegressionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_blog', articles=40, comments=5, tags=20, categories=3, stdout=StringIO())
+
+    def test_routes(self):
+        results = benchmarks.run(repeat=1)
+        self.assertIn('index', results)
+        for name, result in results.items():
+            self.assertLess(result['status'], 400, name)
+            budget = settings.QUERY_BUDGETS.get(name)
+            if budget is not None:
+                self.assertLessEqual(result['queries'], budget, name)
+
+    def test_compare(self):
+        baseline = {'index': {'queries': 3, 'wall_ms': 10.0, 'sql_ms': 1.0}}
+        self.assertEqual(benchmarks.compare({'index': {'queries': 3, 'wall_ms': 12.0, 'sql_ms': 1.0}}, baseline), [])
+        self.assertEqual(len(benchmarks.compare({'index': {'queries': 4, 'wall_ms': 30.0, 'sql_ms': 1.0}}, baseline)), 2)
+
+
+class TagsTestCase(TestCase):
+    def setUp(self):
+        tag_cache.clear()
+        self.addCleanup(tag_cache.clear)
+
+    def test_parse_tags(self):
+        self.assertEqual(parse_tags(' Python , python,WEB   dev,, PYTHON'), ['python', 'web dev'])
+        self.assertEqual(parse_tags('x' * 40), ['x' * 31])
+        self.assertEqual(parse_tags(None), [])
+
+    def test_resolve_tags(self):
+        existing = Tag.objects.create(name='python')
+        # one lookup, one insert for both new tags, one lookup of their ids
+        with self.assertNumQueries(3):
+            ids = resolve_tags(['web', 'python', 'django'])
+        self.assertEqual(ids[1], existing.pk)
+        self.assertEqual(dict(Tag.objects.values_list('pk', 'name')), dict(zip(ids, ['web', 'python', 'django'])))
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_tags(['django', 'web']), [ids[2], ids[0]])
+
+    def test_cache_is_bounded(self):
+        cache = TagCache(2)
+        cache.set_many({'a': 1, 'b': 2})
+        cache.get_many(['a'])
+        cache.set_many({'c': 3})
+        # b was the least recently used
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+
+    def test_merge_migration(self):
+        # the unique index is only added after the merge, these names differ
+        # in case and spaces only so they fit in it
+        Tag.objects.bulk_create([Tag(name=name) for name in ('python', 'Python', ' PYTHON ', '  ', 'Web   Dev')])
+        keeper, upper, spaced, empty, renamed = Tag.objects.order_by('pk')
+        first, second = create_articles(2, comments=0, tags=0)
+        first.tags.set([keeper, upper])
+        second.tags.set([spaced, empty, renamed])
+        migration = import_module('webapp.migrations.0008_tag_name_unique')
+        migration.merge_duplicate_tags(django_apps, None)
+        self.assertEqual(list(Tag.objects.order_by('pk').values_list('pk', 'name')),
+                         [(keeper.pk, 'python'), (renamed.pk, 'web dev')])
+        self.assertEqual(list(first.tags.all()), [keeper])
+        self.assertEqual(set(second.tags.all()), {keeper, Tag.objects.get(pk=renamed.pk)})
+
+
+class TagRetryTestCase(TransactionTestCase):
+    # foreign keys are checked when the transaction commits
+
+    def setUp(self):
+        tag_cache.clear()
+        self.addCleanup(tag_cache.clear)
+        self.article = create_articles(1, comments=0, tags=0)[0]
+
+    def tearDown(self):
+        # the deletes also clear the search index, which flush leaves alone
+        Article.objects.all().delete()
+
+    def test_stale_cached_id(self):
+        tag = Tag.objects.create(name='python')
+        resolve_tags(['python'])
+        # deleted by another process, this one never heard of it
+        Tag.objects.filter(pk=tag.pk)._raw_delete('default')
+        with patch.object(tag_cache, 'clear', wraps=tag_cache.clear) as clear:
+            set_article_tags(self.article, 'python, web')
+        clear.assert_called_once_with()
+        self.assertEqual(sorted(self.article.tags.values_list('name', flat=True)), ['python', 'web'])
+        self.assertNotEqual(Tag.objects.get(name='python').pk, tag.pk)
+
+
+class TagFilterTestCase(TestCase):
+    def setUp(self):
+        self.articles = create_articles(3, comments=0)
+
+    def test_big_tag_is_cached(self):
+        tag_id = Tag.objects.get(name='tag0').pk
+        with self.settings(TAG_FILTER_MAX_IDS=2):
+            self.assertEqual(tag_article_ids([tag_id]), {tag_id: None})
+            with self.assertNumQueries(0):
+                self.assertEqual(tag_article_ids([tag_id]), {tag_id: None})
+            self.assertEqual(set(filter_by_tags(Article.objects.all(), ['tag0'])), set(self.articles))
+
+
+class AuthorFilterTestCase(TestCase):
+    def test_lookups(self):
+        create_articles(4)
+        request = RequestFactory().get('/admin/webapp/article/', {'author': 'someone'})
+        author_filter = AuthorFilter(request, request.GET.dict(), Article, None)
+        # comment authors are not choices, the current value always is
+        self.assertEqual([value for value, label in author_filter.lookups(request, None)],
+                         ['author0', 'author2', 'author1', 'someone'])
+
+
+class ArticleSearchTestCase(TestCase):
+    queries = ['ello', 'Hello', 'HELLO WORLD', 'lo wo', 'python', 'cpython web', 'thon', 'привет', '100%',
+               '"quoted"', 'el', 'nothing']
+    column_sets = [['in_title'], ['in_text'], ['in_tags'], ['in_comment_text'],
+                   ['in_title', 'in_text', 'in_tags', 'in_comment_text']]
+
+    def setUp(self):
+        python, web = Tag.objects.create(name='python'), Tag.objects.create(name='cpython web')
+        rows = [
+            ('Hello world', 'Plain text', [python], ['Yellow comment']),
+            ('Yellow submarine', 'A "quoted" word', [web], []),
+            ('Другое', 'привет, мир', [python, web], ['hello there']),
+            ('100% done', 'Nothing here', [], ['Cello']),
+            ('Python tips', 'hello-world example', [], []),
+        ]
+        for i, (title, text, tags, comments) in enumerate(rows):
+            article = Article.objects.create(title=title, text=text, author='author{}'.format(i % 2))
+            article.tags.set(tags)
+            for comment in comments:
+                Comment.objects.create(article=article, text=comment, author='reader')
+
+    def result_ids(self, data, use_index, view=None):
+        view = view or ArticleSearchView()
+        form = FullSearchForm(data)
+        self.assertTrue(form.is_valid(), form.errors)
+        return view.get_result_ids(form, use_index, view.get_filter_query(form, use_index))
+
+    def test_same_results_as_icontains(self):
+        self.assertTrue(search.is_available())
+        for text in self.queries:
+            for columns in self.column_sets:
+                data = dict({column: 'on' for column in columns}, text=text)
+                use_index = search.can_match([text])
+                with self.subTest(text=text, columns=columns):
+                    self.assertEqual(sorted(self.result_ids(data, use_index)), sorted(self.result_ids(data, False)))
+
+    def test_mid_word_substring(self):
+        response = self.client.post(reverse('article_search'), {'text': 'ello', 'in_title': 'on'})
+        self.assertEqual({article.title for article in response.context['articles']},
+                         {'Hello world', 'Yellow submarine'})
+
+    def test_author_filter_before_limit(self):
+        for i in range(6):
+            Article.objects.create(title='hello hello', text='hello', author='someone')
+        view = ArticleSearchView()
+        view.results_limit = 2
+        data = {'text': 'hello', 'in_title': 'on', 'in_text': 'on', 'author': 'author0', 'article_author': 'on'}
+        self.assertEqual(sorted(self.result_ids(data, True, view)), sorted(self.result_ids(data, False)))
+        self.assertEqual(len(self.result_ids(data, True, view)), 2)
+
+    def test_unavailable_is_cached(self):
+        key = ('default', connections['default'].settings_dict['NAME'])
+        available = search._available.pop(key, None)
+        search._available[key] = False
+        try:
+            with self.assertNumQueries(0):
+                self.assertFalse(search.is_available('default'))
+        finally:
+            del search._available[key]
+            if available is not None:
+                search._available[key] = available
+
+    def test_migrations_without_fts5(self):
+        statements = []
+
+        def execute(sql):
+            if sql.startswith('CREATE VIRTUAL TABLE'):
+                raise OperationalError('no such module: fts5')
+            statements.append(sql)
+
+        schema_editor = SimpleNamespace(connection=connections['default'], execute=execute)
+        import_module('webapp.migrations.0007_article_search_index').create_search_index(None, schema_editor)
+        self.assertEqual(statements, [])
+        trigram = import_module('webapp.migrations.0013_article_search_trigram')
+        trigram.use_trigrams(None, schema_editor)
+        trigram.use_words(None, schema_editor)
+        self.assertEqual(statements, ['DROP TABLE IF EXISTS webapp_article_fts'] * 2)
+
+
+@override_settings(BLOG_CACHE_SINGLE_PROCESS=True)
+class FragmentCacheTestCase(TestCase):
+    def setUp(self):
+        self.articles = create_articles(2, comments=0)
+        self.fragments = FragmentCache('article')
+
+    def render(self, articles=None):
+        articles = articles or list(Article.objects.order_by('pk'))
+        return self.fragments.render_many(articles, lambda article: article.title)
+
+    def test_hits(self):
+        self.render()
+        self.assertEqual(self.render(), ['Article number 0', 'Article number 1'])
+        self.assertEqual(self.fragments.stats(), {'hits': 2, 'misses': 2})
+
+    def test_write_after_load(self):
+        articles = list(Article.objects.order_by('pk'))
+        Article.objects.filter(pk=articles[0].pk).update(title='Renamed article')
+        bump_versions('article', [articles[0].pk])
+        # rendered from the old row, but not stored under the new version
+        self.assertEqual(self.render(articles)[0], 'Article number 0')
+        self.assertEqual(self.render()[0], 'Renamed article')
+
+    def test_process_local_cache(self):
+        with self.settings(BLOG_CACHE_SINGLE_PROCESS=False):
+            self.render()
+            self.render()
+        self.assertEqual(self.fragments.stats(), {'hits': 0, 'misses': 4})
+        self.assertFalse(any(key.startswith('fragment:') for key in get_cache()._cache))
+
+
+class ReplicaRoutingTestCase(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.connections = {
+            'default': SimpleNamespace(vendor='sqlite', settings_dict={'NAME': 'primary.sqlite3'}),
+            'replica': SimpleNamespace(vendor='sqlite', settings_dict={'NAME': 'replica.sqlite3'}),
+        }
+
+    def view(self, request):
+        self.used_replicas = routers._state.use_replicas
+        return HttpResponse()
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_router(self):
+        with patch.object(routers, 'connections', self.connections):
+            self.assertEqual(self.router.db_for_read(Article), 'default')
+            routers._state.use_replicas = True
+            try:
+                self.assertEqual(self.router.db_for_read(Article), 'replica')
+                self.assertEqual(self.router.db_for_write(Article), 'default')
+                # a test mirror of the primary
+                self.connections['replica'].settings_dict['NAME'] = 'primary.sqlite3'
+                self.assertEqual(self.router.db_for_read(Article), 'default')
+            finally:
+                routers._state.use_replicas = False
+        self.assertFalse(self.router.allow_migrate('replica', 'webapp'))
+        self.assertTrue(self.router.allow_migrate('default', 'webapp'))
+
+    def test_middleware(self):
+        middleware = ReplicaPinningMiddleware(self.view)
+        factory = RequestFactory()
+        response = middleware(factory.get('/'))
+        self.assertTrue(self.used_replicas)
+        self.assertFalse(routers._state.use_replicas)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        response = middleware(factory.post('/'))
+        self.assertFalse(self.used_replicas)
+        cookie = response.cookies[PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+        self.assertAlmostEqual(float(cookie.value), time.time() + settings.REPLICA_PIN_SECONDS, delta=1)
+
+        # the client reads from the primary until the pin runs out
+        for value, used_replicas in ((cookie.value, False), (str(time.time() - 1), True), ('bad', True)):
+            request = factory.get('/')
+            request.COOKIES[PIN_COOKIE] = value
+            middleware(request)
+            self.assertEqual(self.used_replicas, used_replicas)
+
+    def test_primary_only(self):
+        response = ReplicaPinningMiddleware(primary_only(self.view))(RequestFactory().get('/'))
+        self.assertFalse(self.used_replicas)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_sync_replica(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for alias in self.connections:
+                self.connections[alias].settings_dict['NAME'] = os.path.join(directory, alias + '.sqlite3')
+            with sqlite3.connect(self.connections['default'].settings_dict['NAME']) as primary:
+                primary.execute('CREATE TABLE item (name TEXT)')
+                primary.execute("INSERT INTO item VALUES ('synced')")
+            primary.close()
+            with override_settings(DATABASE_REPLICAS=['replica']), \
+                    patch.object(sync_replica, 'connections', self.connections):
+                call_command('sync_replica', stdout=StringIO())
+            replica = sqlite3.connect(self.connections['replica'].settings_dict['NAME'])
+            self.assertEqual(replica.execute('SELECT name FROM item').fetchall(), [('synced',)])
+            replica.close()
+
+            self.connections['replica'].vendor = 'postgresql'
+            with override_settings(DATABASE_REPLICAS=['replica']), \
+                    patch.object(sync_replica, 'connections', self.connections):
+                self.assertRaises(CommandError, call_command, 'sync_replica')
+        self.assertRaises(CommandError, call_command, 'sync_replica')
+
+
+class ProductionTemplatesTestCase(TestCase):
+    def setUp(self):
+        self.articles = create_articles(4)
+
+    def test_main_pages(self):
+        templates = copy.deepcopy(settings.TEMPLATES)
+        templates[0]['APP_DIRS'] = False
+        templates[0]['OPTIONS']['loaders'] = settings.PRODUCTION_TEMPLATE_LOADERS
+        pk = self.articles[0].pk
+        with self.settings(TEMPLATES=templates):
+            loader = engines['django'].engine.template_loaders[0]
+            self.assertIsInstance(loader, CachedLoader)
+            warmup.warm_up()
+            self.assertTrue(loader.get_template_cache)
+            for url in (reverse('index'), reverse('article_view', kwargs={'pk': pk}), reverse('article_search'),
+                        reverse('popular_articles'), reverse('comment_index'), reverse('article_add'),
+                        reverse('article_update', kwargs={'pk': pk})):
+                with self.subTest(url=url):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+            response = self.client.post(reverse('article_search'), {'text': 'Article', 'in_title': 'on'})
+            self.assertContains(response, 'Article number 3')
+
+    def test_without_admin(self):
+        # settings are read once per process, so BLOG_ADMIN=0 needs a fresh one
+        code = ('import sys, django; django.setup(); import main.urls; '
+                'print(any(name.startswith("django.contrib.admin") for name in sys.modules))')
+        env = dict(os.environ, BLOG_ADMIN='0', DJANGO_SETTINGS_MODULE='main.settings')
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env)
+        self.assertEqual(output.strip(), b'False')
+
+
+class SearchCacheTestCase(TestCase):
+    def setUp(self):
+        self.articles = create_articles(4, comments=0)
+        self.url = reverse('article_search')
+
+    def search(self, text):
+        response = self.client.post(self.url, {'text': text, 'in_title': 'on'})
+        return [article.pk for article in response.context['articles']]
+
+    def stats_after(self, request):
+        before = search_cache.stats()
+        result = request()
+        after = search_cache.stats()
+        return result, {name: after[name] - before[name] for name in after}
+
+    def test_hit(self):
+        ids, stats = self.stats_after(lambda: self.search('Article number'))
+        self.assertEqual(stats, {'hits': 0, 'misses': 1})
+        self.assertEqual(sorted(ids), sorted(article.pk for article in self.articles))
+        # case and surrounding whitespace do not change the key
+        cached, stats = self.stats_after(lambda: self.search('  article NUMBER '))
+        self.assertEqual(stats, {'hits': 1, 'misses': 0})
+        self.assertEqual(cached, ids)
+
+    def test_inner_whitespace(self):
+        self.assertEqual(self.search('article  number'), [])
+        ids, stats = self.stats_after(lambda: self.search('article number'))
+        self.assertEqual(stats, {'hits': 0, 'misses': 1})
+        self.assertEqual(len(ids), 4)
+
+    def test_write_invalidates(self):
+        self.search('Renamed')
+        self.articles[0].title = 'Renamed article'
+        self.articles[0].save()
+        ids, stats = self.stats_after(lambda: self.search('Renamed'))
+        self.assertEqual(stats, {'hits': 0, 'misses': 1})
+        self.assertEqual(ids, [self.articles[0].pk])
+
+    def test_max_ids(self):
+        url = reverse('index')
+        with self.settings(SEARCH_CACHE_MAX_IDS=2):
+            for i in range(2):
+                response, stats = self.stats_after(lambda: self.client.get(url, {'search': 'Article'}))
+                # longer results are paginated from the queryset and never stored
+                self.assertEqual(stats, {'hits': 0, 'misses': 1})
+                self.assertEqual(len(response.context['articles']), 4)
+        response, stats = self.stats_after(lambda: self.client.get(url, {'search': 'Article'}))
+        self.assertEqual(stats, {'hits': 0, 'misses': 1})
+        response, stats = self.stats_after(lambda: self.client.get(url, {'search': 'Article'}))
+        self.assertEqual(stats, {'hits': 1, 'misses': 0})
+
+
+class SQLiteProfileTestCase(TestCase):
+    def test_new_connection(self):
+        # the first request of a worker opens its connection, the PRAGMAs
+        # must not count against the budget
+        connection = connections['default'].copy()
+        counter = QueryCounter()
+        default = connections._connections.default
+        connections._connections.default = connection
+        try:
+            with connection.execute_wrapper(counter):
+                self.client.get(reverse('comment_index'))
+                self.assertLessEqual(counter.count, settings.QUERY_BUDGETS['comment_index'])
+                with connection.cursor() as cursor:
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PROFILE['busy_timeout'])
+        finally:
+            connections._connections.default = default
+            connection.connection.close()
+
+
+class CommentWriteBehindTestCase(TransactionTestCase):
+    # the writer thread has its own connection, it only sees committed rows
+
+    def setUp(self):
+        self.article = create_articles(1, comments=0)[0]
+
+    def tearDown(self):
+        # the deletes also clear the search index, which flush leaves alone
+        Article.objects.all().delete()
+
+    def writer(self, batch_size=100, max_delay=0.05, retries=2):
+        writer = CommentWriteBehind(batch_size, max_delay, retries, retry_delay=0.01)
+        self.addCleanup(writer.stop)
+        self.batches = []
+        write = writer._write
+        writer._write = lambda batch: (self.batches.append(len(batch)), write(batch))
+        return writer
+
+    def submit(self, writer, count, article=None):
+        for i in range(count):
+            writer.submit(Comment(article=article or self.article, text='Queued {}'.format(i), author='reader'))
+
+    def wait_written(self, writer, timeout=2):
+        # reading while the thread writes would hit the shared-cache table lock
+        with writer._condition:
+            writer._condition.wait_for(lambda: writer._pending == 0, timeout=timeout)
+        return Comment.objects.count()
+
+    def test_batch_size(self):
+        writer = self.writer(batch_size=3, max_delay=5)
+        start = time.monotonic()
+        self.submit(writer, 3)
+        self.assertEqual(self.wait_written(writer), 3)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(self.batches, [3])
+
+    def test_max_delay(self):
+        writer = self.writer(batch_size=100, max_delay=0.05)
+        self.submit(writer, 2)
+        self.assertEqual(self.wait_written(writer), 2)
+        self.assertEqual(self.batches, [2])
+
+    def test_stop_flushes(self):
+        writer = self.writer(batch_size=100, max_delay=0.3)
+        self.submit(writer, 2)
+        writer.stop()
+        self.assertEqual(Comment.objects.count(), 2)
+
+    def test_counters_and_search(self):
+        writer = self.writer()
+        self.submit(writer, 2)
+        writer.flush()
+        article = Article.objects.get(pk=self.article.pk)
+        self.assertEqual(article.comments_count, 2)
+        self.assertEqual(article.last_comment_at, Comment.objects.order_by('-updated_at')[0].updated_at)
+        self.assertEqual(search.search_article_ids(['Queued'], ['comments']), [self.article.pk])
+
+    def test_deleted_article(self):
+        other = Article.objects.create(title='Deleted', text='Text', author='author')
+        writer = self.writer(max_delay=0.3)
+        self.submit(writer, 1)
+        self.submit(writer, 1, other)
+        other.delete()
+        writer.stop()
+        self.assertEqual(list(Comment.objects.values_list('article_id', flat=True)), [self.article.pk])
+
+    def failing_bulk_create(self, failures):
+        """bulk_create failing with a lock timeout failures times, then writing."""
+        bulk_create = Comment.objects.bulk_create
+        self.attempts = 0
+
+        def side_effect(objs):
+            self.attempts += 1
+            if self.attempts <= failures:
+                raise OperationalError('database is locked')
+            return bulk_create(objs)
+        return patch.object(Comment.objects, 'bulk_create', side_effect=side_effect)
+
+    def test_retry(self):
+        writer = self.writer(retries=2)
+        with self.failing_bulk_create(2), self.assertLogs('webapp.writebehind', 'WARNING'):
+            self.submit(writer, 2)
+            writer.flush()
+        self.assertEqual(self.attempts, 3)
+        self.assertEqual(Comment.objects.count(), 2)
+
+    def test_give_up(self):
+        writer = self.writer(retries=2)
+        with self.failing_bulk_create(3), self.assertLogs('webapp.writebehind', 'WARNING') as logs:
+            self.submit(writer, 2)
+            writer.flush()
+        self.assertEqual(self.attempts, 3)
+        self.assertIn('Dropped 2 queued comments after 3 attempts', logs.output[-1])
+        self.assertTrue(logs.output[-1].startswith('ERROR'))
+        self.assertEqual(Comment.objects.count(), 0)
+
+    def test_read_your_writes(self):
+        self.addCleanup(comment_writer.stop)
+        url = reverse('article_view', kwargs={'pk': self.article.pk})
+        with self.settings(COMMENT_WRITE_BEHIND=dict(settings.COMMENT_WRITE_BEHIND, ENABLED=True)):
+            response = self.client.post(reverse('article_comment_create', kwargs={'pk': self.article.pk}),
+                                        {'text': 'My queued comment', 'author': 'reader'})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertEqual(response.cookies[PENDING_COOKIE].value, str(self.article.pk))
+        response = self.client.get(url)
+        self.assertContains(response, 'My queued comment')
+        self.assertEqual(response.cookies[PENDING_COOKIE]['max-age'], 0)
+
+
+class PrefixIndexTestCase(TestCase):
+    def test_ranking(self):
+        index = PrefixIndex([('Python', 5), ('pytest', 9), ('PYTHON', 2), ('perl', 1), ('java', 20)])
+        self.assertEqual(index.lookup('py'), ['pytest', 'Python'])
+        self.assertEqual(index.lookup(' PYT ', limit=1), ['pytest'])
+        self.assertEqual(index.top(2), ['java', 'pytest'])
+        self.assertEqual(index.lookup('x'), [])
+        self.assertEqual(index.lookup(''), [])
+
+    def test_add_remove(self):
+        index = PrefixIndex([('python', 1)], keep_empty=False)
+        index.add('Pyramid', 3)
+        self.assertEqual(index.lookup('py'), ['Pyramid', 'python'])
+        index.add('pyramid', -3)
+        self.assertEqual(index.lookup('py'), ['python'])
+        index.add('python')
+        index.remove('python')
+        self.assertEqual(len(index), 0)
+        kept = PrefixIndex([('python', 1)])
+        kept.add('python', -1)
+        kept.add('pyramid', 0)
+        self.assertEqual(sorted(kept.lookup('py')), ['pyramid', 'python'])
+
+    def test_memo_invalidation(self):
+        index = PrefixIndex([('python', 2), ('pytest', 1)], memo_depth=2)
+        self.assertEqual(index.lookup('py'), ['python', 'pytest'])
+        self.assertIn('py', index._memo)
+        index.add('pytest', 5)
+        self.assertNotIn('py', index._memo)
+        self.assertEqual(index.lookup('py'), ['pytest', 'python'])
+        self.assertEqual(index.top(1), ['pytest'])
+        index.remove('pytest')
+        self.assertEqual(index.lookup('p'), ['python'])
+
+
+class AutocompleteReloadTestCase(TestCase):
+    def test_reload(self):
+        tags = autocomplete.Autocomplete(autocomplete.load_tags)
+        Tag.objects.create(name='python')
+        self.assertEqual(tags.lookup('py'), ['python'])
+        # written by another worker, no signal reaches this process
+        Tag.objects.bulk_create([Tag(name='pyramid')])
+        self.assertEqual(tags.lookup('py'), ['python'])
+        with patch.object(tags, 'reload_in_background') as reload_in_background:
+            tags.lookup('py')
+            reload_in_background.assert_not_called()
+            with self.settings(AUTOCOMPLETE_RELOAD_INTERVAL=0):
+                tags.lookup('py')
+            reload_in_background.assert_called_once_with()
+        tags.reload()
+        self.assertEqual(sorted(tags.lookup('py')), ['pyramid', 'python'])
+
+
+class AutocompleteSignalsTestCase(TransactionTestCase):
+    # the indexes are updated on commit
+
+    def setUp(self):
+        self.article = create_articles(1, comments=0, tags=0)[0]
+        for index in autocomplete.KINDS.values():
+            index.reset()
+            index.get_index()
+            self.addCleanup(index.reset)
+
+    def tearDown(self):
+        # the deletes also clear the search index, which flush leaves alone
+        Article.objects.all().delete()
+
+    def test_tags(self):
+        set_article_tags(self.article, 'python, pyramid')
+        other = Article.objects.create(title='Other article', text='Text', author='someone')
+        set_article_tags(other, 'python')
+        self.assertEqual(autocomplete.tags.lookup('py'), ['python', 'pyramid'])
+        tag = Tag.objects.get(name='pyramid')
+        tag.name = 'pylons'
+        tag.save()
+        self.assertEqual(autocomplete.tags.lookup('py'), ['python', 'pylons'])
+        Tag.objects.get(name='python').delete()
+        self.assertEqual(autocomplete.tags.lookup('py'), ['pylons'])
+        other.tags.add(Tag.objects.create(name='pytest'))
+        self.assertEqual(autocomplete.tags.lookup('pyt'), ['pytest'])
+
+    def test_authors(self):
+        self.assertEqual(autocomplete.authors.lookup('auth'), ['author0'])
+        self.article.author = 'writer'
+        self.article.save()
+        self.assertEqual(autocomplete.authors.lookup('auth'), [])
+        self.assertEqual(autocomplete.authors.lookup('wr'), ['writer'])
+        Comment.objects.create(article=self.article, text='Comment', author='reader')
+        self.assertEqual(autocomplete.authors.lookup('re'), ['reader'])
+        self.article.delete()
+        self.assertEqual(autocomplete.authors.lookup('wr'), [])
+        self.assertEqual(autocomplete.authors.lookup('re'), [])
+
+
+class CommentCountersTestCase(TestCase):
+    def setUp(self):
+        self.first, self.second = create_articles(2, comments=0, tags=0)
+
+    def assertCounters(self, article, count):
+        article.refresh_from_db()
+        last = article.comments.aggregate(last=Max('updated_at'))['last']
+        self.assertEqual((article.comments_count, article.last_comment_at), (count, last))
+
+    def test_views(self):
+        self.client.post(reverse('article_comment_create', kwargs={'pk': self.first.pk}),
+                         {'text': 'First comment', 'author': 'reader'})
+        self.client.post(reverse('article_comment_create', kwargs={'pk': self.first.pk}),
+                         {'text': 'Second comment', 'author': 'reader'})
+        self.client.post(reverse('comment_add'), {'text': 'Other comment', 'author': 'reader',
+                                                  'article': self.second.pk})
+        self.assertCounters(self.first, 2)
+        self.assertCounters(self.second, 1)
+
+        moved = Comment.objects.get(text='Second comment')
+        self.client.post(reverse('comment_update', kwargs={'pk': moved.pk}),
+                         {'text': 'Moved comment', 'author': 'reader', 'article': self.second.pk})
+        self.assertCounters(self.first, 1)
+        self.assertCounters(self.second, 2)
+
+        for comment in self.first.comments.all():
+            self.client.get(reverse('comment_delete', kwargs={'pk': comment.pk}))
+        self.assertCounters(self.first, 0)
+        self.assertIsNone(self.first.last_comment_at)
+        self.client.get(reverse('comment_delete', kwargs={'pk': moved.pk}))
+        self.assertCounters(self.second, 1)
+
+    def test_reconcile(self):
+        Comment.objects.create(article=self.first, text='Comment', author='reader')
+        Article.objects.filter(pk=self.second.pk).update(comments_count=5, last_comment_at=timezone.now())
+        out = StringIO()
+        call_command('reconcile_comment_counters', '--dry-run', stdout=out)
+        self.assertIn('2 drifted (dry run)', out.getvalue())
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.comments_count, 5)
+        out = StringIO()
+        call_command('reconcile_comment_counters', '--batch-size', '1', stdout=out)
+        self.assertIn('Checked 2 articles, 2 drifted', out.getvalue())
+        self.assertCounters(self.first, 1)
+        self.assertCounters(self.second, 0)
+
+
+class CursorPaginatorTestCase(TestCase):
+    def setUp(self):
+        self.articles = create_articles(4, comments=0)
+
+    def encode(self, data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+
+    def test_malformed_cursors(self):
+        paginator = CursorPaginator(Article.objects.all(), 2)
+        first = [article.pk for article in paginator.get_page().object_list]
+        cursors = ['garbage', '!!!', self.encode(['next']), self.encode(['up', ['2020-01-01T00:00:00', 1]]),
+                   self.encode(['next', ['2020-13-01T00:00:00', 1]]), self.encode(['next', [{'a': 1}, 1]]),
+                   self.encode(['next', [None, 1]]), self.encode(['next', [True, 1]])]
+        for cursor in cursors:
+            self.assertEqual(paginator.decode_cursor(cursor), (None, None), cursor)
+            self.assertEqual([article.pk for article in paginator.get_page(cursor).object_list], first)
+        response = self.client.get(reverse('api_article_list'), {'cursor': cursors[4]})
+        self.assertEqual(response.status_code, 200)
+        with self.settings(CURSOR_PAGINATION=True):
+            self.assertEqual(self.client.get(reverse('index'), {'cursor': cursors[5]}).status_code, 200)
+
+
+class ApiTestCase(TestCase):
+    def setUp(self):
+        self.articles = create_articles(5, comments=5)
+
+    def follow(self, url, key=None):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            data = data[key] if key else data
+            pages.append(data)
+            url = data['next']
+        return pages
+
+    def test_fields(self):
+        response = self.client.get(reverse('api_article_list'), {'fields': 'id, title,tags'})
+        self.assertEqual(response.json()['results'][0], {'id': self.articles[-1].pk, 'title': 'Article number 4',
+                                                         'tags': ['tag0', 'tag1', 'tag2']})
+        url = reverse('api_article_detail', kwargs={'pk': self.articles[0].pk})
+        data = self.client.get(url, {'fields': 'title,category', 'comment_fields': 'text'}).json()
+        self.assertEqual(set(data), {'title', 'category', 'comments'})
+        self.assertEqual(data['category'], 'Category')
+        self.assertEqual(set(data['comments']['results'][0]), {'text'})
+
+    def test_unknown_fields(self):
+        url = reverse('api_article_detail', kwargs={'pk': self.articles[0].pk})
+        for url, query in ((reverse('api_article_list'), {'fields': 'id,password'}),
+                           (reverse('api_tag_list'), {'fields': 'tags'}),
+                           (url, {'fields': 'text,secret'}), (url, {'comment_fields': 'article'})):
+            with self.subTest(url=url, query=query):
+                response = self.client.get(url, query)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Unknown fields', response.json()['error'])
+
+    def test_not_found(self):
+        response = self.client.get(reverse('api_article_detail', kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'not found'})
+
+    def test_cursors(self):
+        url = '{}?page_size=2&fields=id'.format(reverse('api_article_list'))
+        pages = self.follow(url)
+        newest_first = [article.pk for article in reversed(self.articles)]
+        self.assertEqual([[row['id'] for row in page['results']] for page in pages],
+                         [newest_first[:2], newest_first[2:4], newest_first[4:]])
+        self.assertIsNone(pages[0]['previous'])
+        previous = self.client.get(pages[-1]['previous']).json()
+        self.assertEqual(previous['results'], pages[1]['results'])
+
+        url = '{}?page_size=2'.format(reverse('api_article_detail', kwargs={'pk': self.articles[0].pk}))
+        pages = self.follow(url, 'comments')
+        comments = [row['id'] for page in pages for row in page['results']]
+        self.assertEqual(comments, list(self.articles[0].comments.order_by('-created_at', '-id')
+                                        .values_list('pk', flat=True)))
+        self.assertEqual(len(pages), 3)
+
+
+class QueryPlanTestCase(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        self.articles = create_articles(6)
+
+    def assertPagesUseIndex(self, queryset):
+        paginator = CursorPaginator(queryset, 3)
+        page = paginator.get_page()
+        self.assertNoFullScan(paginator.get_queryset()[:4])
+        self.assertNoFullScan(paginator.get_queryset(page.next_cursor)[:4])
+        self.assertNoFullScan(paginator.get_queryset(paginator.encode_cursor(page.object_list[-1], 'prev'))[:4])
+
+    def test_index(self):
+        self.assertNoFullScan(Article.objects.order_by('-created_at')[:4])
+        self.assertPagesUseIndex(Article.objects.all())
+
+    def test_article_comments(self):
+        comments = self.articles[0].comments.all()
+        self.assertNoFullScan(comments.order_by('-created_at')[:3])
+        self.assertPagesUseIndex(comments)
+
+    def test_author_search(self):
+        form = FullSearchForm({'author': 'Author1', 'article_author': 'on', 'comment_author': 'on'})
+        self.assertTrue(form.is_valid())
+        query = ArticleSearchView().get_author_query(form, form.cleaned_data['author'])
+        self.assertNoFullScan(Article.objects.filter(query))
+
+    def test_tag_filter(self):
+        self.assertNoFullScan(Tag.objects.filter(name__in=['tag0', 'tag1']))
+        self.assertNoFullScan(Article.tags.through.objects.filter(tag_id__in=[1, 2]))
+        self.assertNoFullScan(filter_by_tags(Article.objects.all(), ['tag0', 'tag1']))
+
+    def test_related_articles(self):
+        self.assertNoFullScan(RelatedArticle.objects.filter(article_id=self.articles[0].pk).select_related('related'))
+
+    def test_view_counts(self):
+        self.assertNoFullScan(ArticleViewCount.objects.filter(bucket__gt=viewcounts.bucket_start(0))
+                              .values('article_id').annotate(total=Sum('views')))
+
+
+@override_settings(COMPRESSION=dict(settings.COMPRESSION, ENABLED=True))
+class CompressionTestCase(TestCase):
+    def setUp(self):
+        self.articles = create_articles(3)
+
+    def test_article_view(self):
+        url = reverse('article_view', kwargs={'pk': self.articles[0].pk})
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        first = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        second = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(second['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', second['Vary'])
+        # the cached body is spliced with each request's own CSRF token
+        self.assertNotEqual(gzip.decompress(first.content), gzip.decompress(second.content))
+        self.assertIn(b'csrfmiddlewaretoken', gzip.decompress(second.content))
+        self.assertEqual(len(gzip.decompress(second.content)), len(plain.content))
+
+    @patch.object(compression, 'brotli', SimpleNamespace(compress=lambda body, quality: b'br'))
+    def test_brotli(self):
+        url = reverse('article_view', kwargs={'pk': self.articles[0].pk})
+        # pages with a CSRF token are never brotli compressed
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT_ENCODING='br, gzip')['Content-Encoding'], 'gzip')
+        self.assertFalse(self.client.get(url, HTTP_ACCEPT_ENCODING='br, gzip;q=0').has_header('Content-Encoding'))
+        response = self.client.get(reverse('api_article_list'), HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response.content, b'br')
+
+    @patch.object(compression, 'brotli', SimpleNamespace(compress=lambda body, quality: b'br'))
+    def test_streaming(self):
+        data = {'text': 'Article', 'in_title': 'on', 'format': 'csv'}
+        response = self.client.get(reverse('article_search'), data, HTTP_ACCEPT_ENCODING='br, gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get(reverse('article_search'), data, HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'Article number 0', gzip.decompress(b''.join(response.streaming_content)))
+
+
+@override_settings(PAGE_CACHE=dict(settings.PAGE_CACHE, ENABLED=True, SINGLE_PROCESS=True))
+class PageCacheTestCase(TestCase):
+    def setUp(self):
+        self.articles = create_articles(3)
+        self.url = reverse('article_view', kwargs={'pk': self.articles[0].pk})
+
+    def test_article_view(self):
+        self.client.get(self.url)
+        # only the conditional GET state is queried
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertIn(b'csrfmiddlewaretoken', response.content)
+        self.assertIn('csrftoken', response.cookies)
+        Category.objects.filter(pk=self.articles[0].category_id).get().save()
+        self.articles[0].title = 'Renamed article'
+        self.articles[0].save()
+        self.assertContains(self.client.get(self.url), 'Renamed article')
+
+    def test_stale_copy(self):
+        response = self.client.get(self.url)
+        key = page_cache.key('article', response.wsgi_request)
+        # another request is rebuilding the page
+        get_cache().add(key + ':lock', 1, 10)
+        self.articles[0].title = 'Renamed article'
+        self.articles[0].save()
+        self.assertNotContains(self.client.get(self.url), 'Renamed article')
+        get_cache().delete(key + ':lock')
+        self.assertContains(self.client.get(self.url), 'Renamed article')
+
+    def test_bypass(self):
+        self.client.get(self.url)
+        self.client.cookies['pin_primary'] = '1'
+        stats = page_cache.stats()
+        self.client.get(self.url)
+        self.assertEqual(page_cache.stats(), stats)
+
+    def test_index_listing(self):
+        url = reverse('index')
+        self.client.get(url)
+        stats = page_cache.stats()
+        Comment.objects.create(article=self.articles[0], text='New comment', author='reader')
+        self.client.get(url)
+        # article lists show no comments
+        self.assertEqual(page_cache.stats()['hits'], stats['hits'] + 1)
+        self.articles[2].title = 'Renamed article'
+        self.articles[2].save()
+        self.assertContains(self.client.get(url), 'Renamed article')
+
+    def test_process_local_cache(self):
+        # the test cache is a LocMemCache, other workers would never see a bump
+        with self.settings(PAGE_CACHE=dict(settings.PAGE_CACHE, ENABLED=True, SINGLE_PROCESS=False)):
+            stats = page_cache.stats()
+            self.client.get(self.url)
+            self.assertEqual(page_cache.stats(), stats)
+
+
+class RelatedArticleTestCase(TestCase):
+    def setUp(self):
+        self.tags = [Tag.objects.create(name='tag{}'.format(i)) for i in range(4)]
+        self.articles = [Article.objects.create(title='Article {}'.format(i), text='Text', author='author')
+                         for i in range(4)]
+        for article, tags in zip(self.articles, ([0, 1, 2], [0, 1], [2, 3], [3])):
+            article.tags.set([self.tags[i] for i in tags])
+
+    def related_ids(self, article):
+        return list(RelatedArticle.objects.filter(article=article).values_list('related_id', flat=True))
+
+    def test_rebuild(self):
+        related.rebuild(count=2)
+        self.assertEqual(self.related_ids(self.articles[0]), [self.articles[1].pk, self.articles[2].pk])
+        self.assertEqual(self.related_ids(self.articles[3]), [self.articles[2].pk])
+        response = self.client.get(reverse('article_view', kwargs={'pk': self.articles[3].pk}))
+        self.assertEqual(response.context['related_articles'], [self.articles[2]])
+
+    def test_update(self):
+        related.rebuild(count=2)
+        self.articles[3].tags.set([self.tags[0], self.tags[1]])
+        # tag changes are applied on commit
+        related.update_related([self.articles[3].pk])
+        self.assertEqual(self.related_ids(self.articles[3]), [self.articles[1].pk, self.articles[0].pk])
+        self.assertIn(self.articles[3].pk, self.related_ids(self.articles[1]))
+        self.assertNotIn(self.articles[3].pk, self.related_ids(self.articles[2]))
+
+
+@override_settings(VIEW_COUNTS=dict(settings.VIEW_COUNTS, ENABLED=True))
+class ViewCountTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        # views counted by earlier tests belong to articles that are gone
+        viewcounts.view_counter.flush()
+        self.articles = create_articles(3, comments=0)
+
+    def test_popular(self):
+        for article, views in zip(self.articles, (1, 3, 1)):
+            for _ in range(views):
+                self.client.get(reverse('article_view', kwargs={'pk': article.pk}))
+        self.assertFalse(ArticleViewCount.objects.exists())
+        viewcounts.view_counter.flush()
+        self.client.get(reverse('article_view', kwargs={'pk': self.articles[0].pk}))
+        viewcounts.view_counter.flush()
+        self.assertEqual(ArticleViewCount.objects.get(article=self.articles[0]).views, 2)
+
+        viewcounts.refresh_popular()
+        self.assertEqual(list(PopularArticle.objects.values_list('article_id', 'views')),
+                         [(self.articles[1].pk, 3), (self.articles[0].pk, 2), (self.articles[2].pk, 1)])
+        with self.assertQueryBudget('popular_articles'):
+            response = self.client.get(reverse('popular_articles'))
+        self.assertContains(response, self.articles[1].title)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.articles = create_articles(2)
+        self.url = reverse('article_view', kwargs={'pk': self.articles[0].pk})
+
+    def test_article_view(self):
+        response = self.client.get(self.url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.client.post(reverse('article_comment_create', kwargs={'pk': self.articles[0].pk}),
+                         {'text': 'New comment', 'author': 'reader'})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertContains(response, 'New comment')
+
+    def test_index(self):
+        url = reverse('index')
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, {'search': 'Article'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # a second write within the same second still changes the ETag
+        self.articles[1].title = 'Renamed article'
+        self.articles[1].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Renamed article')
+
+    def test_index_other_process(self):
+        url = reverse('index')
+        etag = self.client.get(url)['ETag']
+        # written by another worker: no signal reaches this process
+        Article.objects.filter(pk=self.articles[1].pk).update(title='Renamed article', updated_at=timezone.now())
+        self.assertContains(self.client.get(url, HTTP_IF_NONE_MATCH=etag), 'Renamed article')
+        etag = self.client.get(url)['ETag']
+        tag = Tag.objects.get(name='tag0')
+        tag.name = 'renamed tag'
+        tag.save()
+        self.assertContains(self.client.get(url, HTTP_IF_NONE_MATCH=etag), 'renamed tag')
+
+    @override_settings(BLOG_CACHE_SINGLE_PROCESS=True)
+    def test_index_shared(self):
+        url = reverse('index')
+        etag = self.client.get(url)['ETag']
+        # the generation is read from the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.articles[1].title = 'Renamed article'
+        self.articles[1].save()
+        self.assertContains(self.client.get(url, HTTP_IF_NONE_MATCH=etag), 'Renamed article')
+
+    def test_related_rename(self):
+        self.articles[1].tags.set(self.articles[0].tags.all())
+        related.rebuild()
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['related_articles'], [self.articles[1]])
+        self.articles[1].title = 'Renamed related'
+        self.articles[1].save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'],
+                                   HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Renamed related')
+
+    def test_category_rename(self):
+        etag = self.client.get(self.url)['ETag']
+        category = self.articles[0].category
+        category.name = 'Renamed'
+        category.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Renamed')
+
+
+class SerialPool:
+    # the in-memory test database is not shared with forked workers
+    def __init__(self, processes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def imap_unordered(self, func, jobs):
+        return map(func, jobs)
+
+
+class ExportImportTestCase(TestCase):
+    def setUp(self):
+        categories = [Category.objects.create(name='Same'), Category.objects.create(name='Same'),
+                      Category.objects.create(name='Other'), None]
+        tags = [Tag.objects.create(name='tag{}'.format(i)) for i in range(3)]
+        for i in range(8):
+            article = Article.objects.create(title='Article number {}'.format(i), text='Text {}'.format(i),
+                                             author='author{}'.format(i % 3), category=categories[i % 4])
+            article.tags.set(tags[:i % 4])
+            for j in range(i % 5):
+                Comment.objects.create(article=article, text='Comment {}'.format(j), author='reader')
+        # the counters are kept by the comment views
+        call_command('reconcile_comment_counters', stdout=StringIO())
+        self.source = list(Article.objects.order_by('pk'))
+        fd, self.path = tempfile.mkstemp(suffix='.ndjson')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        call_command('export_blog', self.path, '--chunk-size', '3', stderr=StringIO())
+
+    def snapshot(self, articles):
+        return [(article.title, article.text, article.author, article.created_at, article.updated_at,
+                 article.category and article.category.name, sorted(tag.name for tag in article.tags.all()),
+                 article.comments_count, article.last_comment_at,
+                 list(article.comments.order_by('pk').values_list('text', 'author', 'created_at', 'updated_at')))
+                for article in articles]
+
+    def import_file(self, *args):
+        first_pk = Article.objects.order_by('-pk')[0].pk + 1
+        call_command('import_blog', self.path, '--batch-size', '4', *args, stdout=StringIO())
+        imported = list(Article.objects.filter(pk__gte=first_pk).order_by('pk'))
+        self.assertEqual(self.snapshot(imported), self.snapshot(self.source))
+        # categories sharing a name are not merged
+        pairs = {(source.category_id, copy.category_id) for source, copy in zip(self.source, imported)}
+        self.assertEqual(len(pairs), len({source for source, _ in pairs}))
+        self.assertEqual(len(pairs), len({copy for _, copy in pairs}))
+        return imported
+
+    def test_round_trip(self):
+        imported = self.import_file()
+        self.assertEqual(imported[0].category_id, self.source[0].category_id)
+        self.assertNotEqual(imported[1].category_id, self.source[1].category_id)
+        self.assertEqual(Category.objects.filter(name='Same').count(), 3)
+
+    @patch('webapp.management.commands.import_blog.multiprocessing.get_context',
+           return_value=SimpleNamespace(Pool=SerialPool))
+    def test_workers(self, get_context):
+        with open(self.path, 'rb') as f:
+            lines = f.readlines()
+        starts, offset = [], 0
+        for line in lines:
+            starts.append((offset, json.loads(line)['type']))
+            offset += len(line)
+        ranges = split_file(self.path, 3)
+        # a range starting inside the comments of an article
+        self.assertIn('comment', [[kind for start, kind in starts if start < begin][-1] for begin, _ in ranges[1:]])
+        self.import_file('--workers', '3')
+
+
+@override_settings(PROFILING=dict(settings.PROFILING, ENABLED=True, SLOW_REQUEST_MS=0, TOP_QUERIES=2))
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        self.articles = create_articles(3)
+        slow_requests.clear()
+        self.addCleanup(slow_requests.clear)
+
+    def test_server_timing(self):
+        response = self.client.get(reverse('index'))
+        timings = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timings), {'db', 'view', 'tpl', 'total'})
+        self.assertRegex(timings['db'], r'^dur=[\d.]+;desc="\d+ queries"$')
+        self.assertRegex(timings['tpl'], r'^dur=[\d.]+$')
+
+    def test_slow_requests(self):
+        self.client.get(reverse('index'))
+        entry = slow_requests.items()[-1]
+        self.assertEqual((entry['method'], entry['url_name'], entry['status']), ('GET', 'index', 200))
+        self.assertLessEqual(len(entry['top_queries']), 2)
+        self.assertTrue(entry['queries'])
+        with self.settings(PROFILING=dict(settings.PROFILING, ENABLED=True, SLOW_REQUEST_MS=60 * 1000)):
+            self.client = self.client_class()
+            self.client.get(reverse('index'))
+        self.assertEqual(len(slow_requests.items()), 1)
+
+    def test_ring_buffer(self):
+        buffer = RingBuffer(2)
+        for i in range(5):
+            buffer.append(i)
+        self.assertEqual(buffer.items(), [3, 4])
+        for i in range(settings.PROFILING['BUFFER_SIZE'] + 5):
+            self.client.get(reverse('index'), {'page': 1, 'n': i})
+        self.assertEqual(len(slow_requests.items()), settings.PROFILING['BUFFER_SIZE'])
+
+    def test_listing_access(self):
+        self.client.get(reverse('index'))
+        url = reverse('slow_requests')
+        response = self.client.get(url)
+        self.assertRedirects(response, '{}?next={}'.format(reverse('admin:login'), url), fetch_redirect_response=False)
+        User.objects.create_user('reader', password='secret')
+        self.client.login(username='reader', password='secret')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.login(username='staff', password='secret')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # newest first
+        self.assertEqual(response.json()['requests'][0]['url_name'], 'slow_requests')
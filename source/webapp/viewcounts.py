@@ -0,0 +1,164 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from webapp.cache import get_cache
+from webapp.models import Article, ArticleViewCount, PopularArticle
+
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 60 * 60
+REFRESH_LOCK_KEY = 'popular:refresh'
+
+# (article_id, bucket, views) per row, far below SQLite's variable limit
+UPSERT_ROWS = 300
+
+
+def bucket_start(timestamp):
+    return datetime.fromtimestamp(int(timestamp) // BUCKET_SECONDS * BUCKET_SECONDS, tz=timezone.utc)
+
+
+def upsert_counts(counts):
+    """Add counts, {(article_id, bucket): views}, to the counter rows in one statement per chunk."""
+    using = router.db_for_write(ArticleViewCount)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table = qn(ArticleViewCount._meta.db_table)
+    article, bucket, views = qn('article_id'), qn('bucket'), qn('views')
+    items = list(counts.items())
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_ROWS):
+            chunk = items[start:start + UPSERT_ROWS]
+            params = []
+            for (article_id, hour), count in chunk:
+                params.extend([article_id, connection.ops.adapt_datetimefield_value(hour), count])
+            cursor.execute(
+                'INSERT INTO {table} ({article}, {bucket}, {views}) VALUES {values} '
+                'ON CONFLICT ({article}, {bucket}) DO UPDATE SET {views} = {views} + excluded.{views}'.format(
+                    table=table, article=article, bucket=bucket, views=views,
+                    values=', '.join(['(%s, %s, %s)'] * len(chunk))),
+                params)
+
+
+def refresh_popular(window_days=None, size=None, retention_days=None):
+    """Rank the articles by their views over the last window_days and drop counters past retention_days."""
+    options = settings.VIEW_COUNTS
+    window_days = window_days or options['POPULAR_WINDOW_DAYS']
+    size = size or options['POPULAR_SIZE']
+    retention_days = retention_days or options['RETENTION_DAYS']
+    current = bucket_start(time.time())
+    totals = ArticleViewCount.objects.filter(bucket__gt=current - timedelta(days=window_days))\
+        .values('article_id').annotate(total=Sum('views')).order_by('-total', '-article_id')[:size]
+    with transaction.atomic():
+        PopularArticle.objects.all().delete()
+        PopularArticle.objects.bulk_create([
+            PopularArticle(rank=rank, article_id=row['article_id'], views=row['total'])
+            for rank, row in enumerate(totals, 1)
+        ])
+    ArticleViewCount.objects.filter(bucket__lte=current - timedelta(days=retention_days)).delete()
+
+
+class ViewCounter:
+    """
+    Counts article views in a per-process Counter, keyed by article and
+    hour. A background thread swaps the Counter out every flush_interval
+    seconds and adds it to the ArticleViewCount rows with batched upserts,
+    so a read only ever takes an in-memory lock. Counts not yet flushed are
+    lost if the process dies. The thread also refreshes the popular
+    articles every refresh_interval seconds, one process at a time through
+    a lock in the blog cache.
+    """
+
+    def __init__(self, flush_interval, refresh_interval):
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._registered = False
+        self._refreshed_at = time.monotonic()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='view-counter', daemon=True)
+            self._thread.start()
+            if not self._registered:
+                atexit.register(self.stop)
+                self._registered = True
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def hit(self, article_id):
+        if self._thread is None:
+            self.start()
+        key = (article_id, int(time.time()) // BUCKET_SECONDS * BUCKET_SECONDS)
+        with self._lock:
+            self.counts[key] += 1
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+            if time.monotonic() - self._refreshed_at >= self.refresh_interval:
+                self._refreshed_at = time.monotonic()
+                if get_cache().add(REFRESH_LOCK_KEY, True, self.refresh_interval):
+                    self._write(refresh_popular)
+            close_old_connections()
+
+    def flush(self):
+        with self._lock:
+            counts, self.counts = self.counts, Counter()
+        if not counts:
+            return
+        self._write(self._write_counts, counts)
+
+    def _write_counts(self, counts):
+        # views of articles deleted since are dropped
+        existing = set(Article.objects.filter(pk__in={article_id for article_id, hour in counts})
+                       .values_list('pk', flat=True))
+        upsert_counts({(article_id, bucket_start(hour)): count
+                       for (article_id, hour), count in counts.items() if article_id in existing})
+
+    def _write(self, write, *args):
+        try:
+            with self._write_lock:
+                write(*args)
+        except Exception:
+            logger.exception('Could not write view counts')
+
+
+view_counter = ViewCounter(settings.VIEW_COUNTS['FLUSH_INTERVAL'], settings.VIEW_COUNTS['POPULAR_REFRESH_INTERVAL'])
+
+
+def is_enabled():
+    return settings.VIEW_COUNTS['ENABLED']
+
+
+def count_view(view):
+    """Count successful GETs of an article page, including pages answered from a cache or with a 304."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if is_enabled() and request.method == 'GET' and response.status_code in (200, 304):
+            view_counter.hit(kwargs['pk'])
+        return response
+    return wrapper
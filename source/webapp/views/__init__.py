@@ -1,4 +1,7 @@
 from.article_views import IndexView, ArticleView, ArticleCreateView,\
-    ArticleDeleteView, ArticleUpdateView, ArticleSearchView
+    ArticleDeleteView, ArticleUpdateView, ArticleSearchView, PopularArticlesView
 from .comment_views import CommentIndexView, CommentCreateView,\
-    CommentDeleteView, CommentUpdateView, CommentForArticleCreateView
\ No newline at end of file
+    CommentDeleteView, CommentUpdateView, CommentForArticleCreateView
+from .profiling_views import SlowRequestsView
+from .api_views import ArticleListApiView, ArticleDetailApiView, TagListApiView, CategoryListApiView, \
+    AutocompleteView
@@ -0,0 +1,194 @@
+from django.http import JsonResponse
+from django.views import View
+
+from webapp import autocomplete
+from webapp.models import Article, Comment, Category, Tag
+from webapp.pagination import CursorPaginator
+from webapp.tags import filter_by_tags
+
+
+ARTICLE_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'text': 'text',
+    'author': 'author',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'category': 'category__name',
+    'comments_count': 'comments_count',
+    'last_comment_at': 'last_comment_at',
+}
+
+COMMENT_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'author': 'author',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+
+class FieldError(ValueError):
+    pass
+
+
+def select_fields(value, available, default, extra=()):
+    """Split ?fields= into (public name, values() lookup) pairs and the requested extra fields."""
+    if not value:
+        names = default
+    else:
+        names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available and name not in extra]
+    if unknown:
+        raise FieldError('Unknown fields: {}'.format(', '.join(unknown)))
+    return [(name, available[name]) for name in names if name in available], [name for name in names if name in extra]
+
+
+def serialize(rows, pairs):
+    return [{name: row[lookup] for name, lookup in pairs} for row in rows]
+
+
+def page_url(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return '{}?{}'.format(request.path, query.urlencode())
+
+
+def get_page_size(request, default, maximum, param='page_size'):
+    try:
+        size = int(request.GET.get(param, default))
+    except ValueError:
+        size = default
+    return min(max(size, 1), maximum)
+
+
+def article_tags(article_ids):
+    tags = {pk: [] for pk in article_ids}
+    through = Article.tags.through.objects.filter(article_id__in=article_ids).order_by('tag__name')
+    for article_id, name in through.values_list('article_id', 'tag__name'):
+        tags[article_id].append(name)
+    return tags
+
+
+class ApiListView(View):
+    """
+    Read-only JSON list served from values() rows: no model instances and
+    no templates. Pages are cursor based, ?fields= picks the keys.
+    """
+    fields = {}
+    default_fields = None
+    extra_fields = ()
+    ordering = ('-created_at', '-id')
+    paginate_by = 20
+    max_page_size = 100
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        try:
+            pairs, extra = select_fields(request.GET.get('fields'), self.fields,
+                                         self.default_fields or list(self.fields), self.extra_fields)
+        except FieldError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        ordering_fields = [field.lstrip('-') for field in self.ordering]
+        lookups = set(lookup for name, lookup in pairs) | set(ordering_fields)
+        paginator = CursorPaginator(self.get_queryset().values(*lookups), get_page_size(request, self.paginate_by, self.max_page_size), self.ordering)
+        page = paginator.get_page(request.GET.get('cursor'))
+        results = serialize(page.object_list, pairs)
+        self.add_extra_fields(page.object_list, results, extra)
+        return JsonResponse({
+            'results': results,
+            'next': page_url(request, page.next_cursor),
+            'previous': page_url(request, page.previous_cursor),
+        })
+
+    def add_extra_fields(self, rows, results, extra):
+        pass
+
+
+class ArticleListApiView(ApiListView):
+    fields = ARTICLE_FIELDS
+    default_fields = ['id', 'title', 'author', 'created_at', 'category', 'comments_count', 'tags']
+    extra_fields = ('tags',)
+
+    def get_queryset(self):
+        queryset = Article.objects.all()
+        tags = [name for name in map(Tag.normalize_name, self.request.GET.getlist('tag')) if name]
+        if tags:
+            queryset = filter_by_tags(queryset, tags, self.request.GET.get('tag_mode') != 'any')
+        return queryset
+
+    def add_extra_fields(self, rows, results, extra):
+        if 'tags' in extra and rows:
+            tags = article_tags([row['id'] for row in rows])
+            for row, result in zip(rows, results):
+                result['tags'] = tags[row['id']]
+
+
+class ArticleDetailApiView(View):
+    comments_paginate_by = 20
+    max_page_size = 100
+
+    def get(self, request, *args, **kwargs):
+        try:
+            pairs, extra = select_fields(request.GET.get('fields'), ARTICLE_FIELDS,
+                                         list(ARTICLE_FIELDS) + ['tags'], ('tags',))
+            comment_pairs, _ = select_fields(request.GET.get('comment_fields'), COMMENT_FIELDS, list(COMMENT_FIELDS))
+        except FieldError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        row = Article.objects.values(*set(lookup for name, lookup in pairs) | {'id'}).filter(pk=kwargs['pk']).first()
+        if row is None:
+            return JsonResponse({'error': 'not found'}, status=404)
+        article = serialize([row], pairs)[0]
+        if 'tags' in extra:
+            article['tags'] = article_tags([row['id']])[row['id']]
+
+        lookups = set(lookup for name, lookup in comment_pairs) | {'created_at', 'id'}
+        comments = Comment.objects.filter(article_id=row['id']).values(*lookups)
+        page_size = get_page_size(request, self.comments_paginate_by, self.max_page_size)
+        page = CursorPaginator(comments, page_size).get_page(request.GET.get('cursor'))
+        article['comments'] = {
+            'results': serialize(page.object_list, comment_pairs),
+            'next': page_url(request, page.next_cursor),
+            'previous': page_url(request, page.previous_cursor),
+        }
+        return JsonResponse(article)
+
+
+class TagListApiView(ApiListView):
+    fields = {'id': 'id', 'name': 'name', 'created_at': 'created_at'}
+    default_fields = ['id', 'name']
+    ordering = ('name',)
+    paginate_by = 100
+    max_page_size = 1000
+
+    def get_queryset(self):
+        return Tag.objects.all()
+
+
+class CategoryListApiView(ApiListView):
+    fields = {'id': 'id', 'name': 'name'}
+    ordering = ('name', 'id')
+    paginate_by = 100
+    max_page_size = 1000
+
+    def get_queryset(self):
+        return Category.objects.all()
+
+
+class AutocompleteView(View):
+    """Prefix matches for ?q= among tag names (?kind=tag) or authors (?kind=author), most used first."""
+
+    def get(self, request, *args, **kwargs):
+        index = autocomplete.KINDS.get(request.GET.get('kind', 'tag'))
+        if index is None:
+            return JsonResponse({'error': 'kind must be one of: {}'.format(', '.join(autocomplete.KINDS))},
+                                status=400)
+        prefix = request.GET.get('q', '')
+        if not prefix.strip():
+            return JsonResponse({'results': []})
+        limit = get_page_size(request, 10, autocomplete.PrefixIndex.MAX_LIMIT, 'limit')
+        return JsonResponse({'results': index.lookup(prefix, limit)})
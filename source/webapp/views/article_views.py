@@ -1,15 +1,32 @@
-from django.core.paginator import Paginator
+from itertools import chain, islice
+
+from django.conf import settings
 from django.db.models import Q
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse_lazy, reverse
+from django.utils.decorators import method_decorator
 from django.utils.http import urlencode
 from django.views import View
-
-from webapp.forms import ArticleForm, CommentForm, SimpleSearchForm, FullSearchForm
-from webapp.models import Article
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from webapp import search
+from webapp.conditional import article_etag, article_last_modified, index_etag
+from webapp.forms import ArticleForm, ArticleCommentForm, SimpleSearchForm, FullSearchForm
+from webapp.models import Article, Comment, Tag, RelatedArticle, PopularArticle
+from webapp.pagecache import cache_anonymous_page, article_page_version, index_page_version
+from webapp.pagination import CountedPaginator, CursorPaginator
+from webapp.searchcache import search_cache
+from webapp.streaming import streaming_export
+from webapp.tags import filter_by_tags, set_article_tags
+from webapp.viewcounts import count_view
+from webapp.writebehind import read_your_writes
 from django.views.generic import TemplateView, ListView, DeleteView, UpdateView, FormView
 
 
+@method_decorator(cache_control(public=True, no_cache=True), name='dispatch')
+@method_decorator(condition(etag_func=index_etag), name='dispatch')
+@method_decorator(cache_anonymous_page('index', index_page_version), name='dispatch')
 class IndexView(ListView):
     context_object_name = 'articles'
     model = Article
@@ -26,25 +43,54 @@ class IndexView(ListView):
             query = form.cleaned_data['search']
         self.form = form
         self.query = query
+        self.tags = [name for name in map(Tag.normalize_name, self.request.GET.getlist('tag')) if name]
+        self.match_all_tags = self.request.GET.get('tag_mode') != 'any'
         return super().get(request, *args, **kwargs)
 
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(object_list=object_list, **kwargs)
+        query = []
         if self.query:
-            context['query'] = urlencode({'search': self.query})
-        tag_filter = self.request.GET
-        if 'tag' in tag_filter:
-            context['articles'] = Article.objects.filter(tags__name=tag_filter.get('tag'))
+            query.append(('search', self.query))
+        query.extend(('tag', tag) for tag in self.tags)
+        if self.tags and not self.match_all_tags:
+            query.append(('tag_mode', 'any'))
+        if query:
+            context['query'] = urlencode(query)
         context['form'] = self.form
         return context
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('category').prefetch_related('tags')
         if self.query:
-            queryset = queryset.filter(Q(title__icontains=self.query) | Q(author__icontains=self.query) | Q(tags__name__iexact=self.query))
+            queryset = queryset.filter(Q(title__icontains=self.query) | Q(author__icontains=self.query) | Q(tags__name__iexact=self.query)).distinct()
+        if self.tags:
+            queryset = filter_by_tags(queryset, self.tags, self.match_all_tags)
         return queryset
 
+    def get_search_ids(self, queryset):
+        def compute():
+            ids = list(queryset.values_list('pk', flat=True)[:settings.SEARCH_CACHE_MAX_IDS + 1])
+            return ids if len(ids) <= settings.SEARCH_CACHE_MAX_IDS else None
+
+        key = search_cache.key('index', text=self.query, tags=self.tags, match_all=self.match_all_tags)
+        return search_cache.get_ids(key, compute)
+
+    def paginate_queryset(self, queryset, page_size):
+        ids = self.get_search_ids(queryset) if self.query else None
+        if ids is not None:
+            # a cached result list only needs the page's rows by primary key
+            paginator, page, ids, is_paginated = super().paginate_queryset(ids, page_size)
+            articles = self.model.objects.select_related('category').prefetch_related('tags').in_bulk(ids)
+            page.object_list = [articles[pk] for pk in ids if pk in articles]
+            return paginator, page, page.object_list, is_paginated
+        if not settings.CURSOR_PAGINATION:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size)
+        page = paginator.get_page(self.request.GET.get('cursor'))
+        return paginator, page, page.object_list, page.has_other_pages()
+
 
 
     def form_valid(self, form):
@@ -53,11 +99,7 @@ class IndexView(ListView):
         return redirect(self.get_success_url())
 
     def parser(self):
-        tags = self.request.POST.get('tags')
-        tag_list = tags.split(',')
-        for tag in tag_list:
-            tag, created = Tag.objects.get_or_create(name=tag)
-            self.object.tags.add(tag)
+        set_article_tags(self.object, self.request.POST.get('tags', ''))
 
     def get_success_url(self):
         return reverse('article_view', kwargs={'pk': self.object.pk})
@@ -69,19 +111,102 @@ class IndexView(ListView):
 class ArticleSearchView(FormView):
     template_name = 'article/search.html'
     form_class = FullSearchForm
+    results_limit = 1000
+    export_formats = ('csv', 'ndjson')
+    export_fields = ['id', 'title', 'author', 'created_at', 'updated_at', 'category', 'comments_count', 'tags']
+    export_chunk_size = 500
+
+    def get(self, request, *args, **kwargs):
+        # an export can be linked to: a GET with a format runs the search
+        if self.get_export_format():
+            form = self.form_class(request.GET)
+            if form.is_valid():
+                return self.form_valid(form)
+            return self.form_invalid(form)
+        return super().get(request, *args, **kwargs)
+
+    def get_export_format(self):
+        export_format = self.request.POST.get('format') or self.request.GET.get('format')
+        return export_format if export_format in self.export_formats else None
 
     def form_valid(self, form):
+        text = form.cleaned_data.get('text')
+        # the index has the same substring semantics as the icontains query,
+        # but cannot match fewer than search.MIN_LENGTH characters
+        use_index = bool(text) and search.can_match([text]) and search.is_available()
+        query = self.get_filter_query(form, use_index)
+        export_format = self.get_export_format()
+        if export_format:
+            rows = self.export_rows(self.result_id_chunks(form, use_index, query))
+            return streaming_export(rows, self.export_fields, export_format, 'search')
+
+        key = search_cache.key('search', text=text, author=form.cleaned_data.get('author'),
+                               options=[name for name, value in form.cleaned_data.items() if value is True])
+        ids = search_cache.get_ids(key, lambda: self.get_result_ids(form, use_index, query))
+        articles = Article.objects.select_related('category').prefetch_related('tags').in_bulk(ids)
+        context = self.get_context_data(articles=[articles[pk] for pk in ids if pk in articles])
+        return self.render_to_response(context)
+
+    def get_result_ids(self, form, use_index, query):
+        if use_index and not query:
+            return search.search_article_ids([form.cleaned_data['text']], self.get_search_columns(form),
+                                             limit=self.results_limit)
+        if use_index:
+            # filtered chunk by chunk, the limit counts the articles left
+            ids = chain.from_iterable(self.result_id_chunks(form, use_index, query))
+            return list(islice(ids, self.results_limit))
+        articles = Article.objects.filter(query).distinct().order_by('-created_at', '-id')
+        return list(articles.values_list('pk', flat=True)[:self.results_limit])
+
+    def get_filter_query(self, form, use_index):
         text = form.cleaned_data.get('text')
         author = form.cleaned_data.get('author')
         query = Q()
-        if text:
+        if text and not use_index:
             query = query & self.get_text_query(form, text)
         if author:
             query = query & self.get_author_query(form, author)
+        return query
 
-        articles = Article.objects.filter(query).distinct()
-        context = self.get_context_data(articles=articles)
-        return self.render_to_response(context)
+    def result_id_chunks(self, form, use_index, query):
+        if use_index:
+            columns = self.get_search_columns(form)
+            for ids in search.iter_article_ids([form.cleaned_data['text']], columns, self.export_chunk_size):
+                if query:
+                    found = set(Article.objects.filter(query, pk__in=ids).values_list('pk', flat=True))
+                    ids = [pk for pk in ids if pk in found]
+                yield ids
+            return
+        ids = (Article.objects.filter(query).distinct().order_by('-created_at', '-id')
+               .values_list('pk', flat=True).iterator(chunk_size=self.export_chunk_size))
+        chunk = []
+        for pk in ids:
+            chunk.append(pk)
+            if len(chunk) >= self.export_chunk_size:
+                yield chunk
+                chunk = []
+        yield chunk
+
+    def export_rows(self, id_chunks):
+        fields = ['id', 'title', 'author', 'created_at', 'updated_at', 'category__name', 'comments_count']
+        for ids in id_chunks:
+            if not ids:
+                continue
+            rows = {row['id']: row for row in Article.objects.filter(pk__in=ids).values(*fields)}
+            tags = {pk: [] for pk in ids}
+            through = Article.tags.through.objects.filter(article_id__in=ids).order_by('tag__name')
+            for article_id, name in through.values_list('article_id', 'tag__name'):
+                tags[article_id].append(name)
+            for pk in ids:
+                row = rows.get(pk)
+                if row is None:
+                    continue
+                row['category'] = row.pop('category__name')
+                row['tags'] = tags[pk]
+                yield {field: row[field] for field in self.export_fields}
+
+    def get_search_columns(self, form):
+        return [column for field, column in search.SEARCH_COLUMNS.items() if form.cleaned_data.get(field)]
 
 
     def get_author_query(self, form, author):
@@ -91,7 +216,9 @@ class ArticleSearchView(FormView):
             query = query | Q(author__iexact=author)
         comment_author = form.cleaned_data.get('comment_author')
         if comment_author:
-            query = query | Q(comments__author__iexact=author)
+            # a subquery instead of the join keeps both sides on their
+            # NOCASE author indexes
+            query = query | Q(pk__in=Comment.objects.filter(author__iexact=author).values('article_id'))
         return query
 
     
@@ -113,19 +240,30 @@ class ArticleSearchView(FormView):
         return query
 
 
+@method_decorator(count_view, name='dispatch')
+@method_decorator(read_your_writes, name='dispatch')
+@method_decorator(cache_control(private=True, no_cache=True), name='dispatch')
+@method_decorator(condition(etag_func=article_etag, last_modified_func=article_last_modified), name='dispatch')
+@method_decorator(cache_anonymous_page('article', article_page_version), name='dispatch')
 class ArticleView(TemplateView):
     template_name = 'article/article.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         article_pk = kwargs.get('pk')
-        article = get_object_or_404(Article, pk=article_pk)
+        article = get_object_or_404(Article.objects.select_related('category'), pk=article_pk)
         context['article'] = article
-        context['form'] = CommentForm()
-        comments = article.comments.order_by('-created_at')
-        paginator = Paginator(comments, 3, 0)
-        page_numder = self.request.GET.get('page', 1)
-        page = paginator.get_page(page_numder)
+        context['related_articles'] = [link.related for link in RelatedArticle.objects.filter(article_id=article.pk)
+                                       .select_related('related').only('related', 'related__title')]
+        context['form'] = ArticleCommentForm()
+        if settings.CURSOR_PAGINATION:
+            paginator = CursorPaginator(article.comments.all(), 3)
+            page = paginator.get_page(self.request.GET.get('cursor'))
+        else:
+            comments = article.comments.order_by('-created_at')
+            paginator = CountedPaginator(comments, 3, 0, count=article.comments_count)
+            page_numder = self.request.GET.get('page', 1)
+            page = paginator.get_page(page_numder)
         context['paginator'] = paginator
         context['page_obj'] = page
         context['comments'] = page.object_list
@@ -135,6 +273,15 @@ class ArticleView(TemplateView):
 
 
 
+class PopularArticlesView(ListView):
+    """The most viewed articles of the last week, ranked by webapp.viewcounts."""
+    context_object_name = 'popular'
+    template_name = 'article/popular.html'
+
+    def get_queryset(self):
+        return PopularArticle.objects.select_related('article__category')
+
+
 class  ArticleCreateView(View):
     def get(self, request, *args, **kwargs):
         form = ArticleForm()
@@ -149,6 +296,7 @@ class  ArticleCreateView(View):
                 text=form.cleaned_data['text'],
                 category=form.cleaned_data['category']
             )
+            set_article_tags(article, form.cleaned_data['tags'])
             return redirect('article_view', pk=article.pk)
         else:
             return render(request, 'article/create.html', context={'form': form})
@@ -164,26 +312,17 @@ class ArticleUpdateView(UpdateView):
     def get_success_url(self):
         return reverse('article_view', kwargs={'pk': self.object.pk})
 
-    def update_tag(self):
-        tags = self.request.POST.get('tags')
-        tags_list = tags.split(',')
-        self.object.tags.clear()
-        for tag in tags_list:
-            tag, created = Tag.objects.get_or_create(name=tag)
-            self.object.tags.add(tag)
+    def update_tag(self, form):
+        set_article_tags(self.object, form.cleaned_data['tags'])
 
     def get_form(self, form_class=None):
         form = super().get_form(form_class=None)
-        querry = self.object.tags.values('name')
-        res = ''
-        for tag in querry:
-            res += tag['name'] + ','
-        form.fields['tags'].initial = res.replace(' ', '').strip(',')
+        form.fields['tags'].initial = ', '.join(self.object.tags.values_list('name', flat=True))
         return form
 
     def form_valid(self, form):
         self.object = form.save()
-        self.update_tag()
+        self.update_tag(form)
         return redirect(self.get_success_url())
 
 
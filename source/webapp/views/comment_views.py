@@ -1,9 +1,13 @@
+from django.db import transaction
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
+from django.utils.decorators import method_decorator
 from django.views import View
 
+from webapp import counters, writebehind
 from webapp.forms import CommentForm, ArticleCommentForm
 from webapp.models import Comment, Article
+from webapp.routers import primary_only
 from django.views.generic import ListView, DeleteView, UpdateView
 
 
@@ -12,6 +16,9 @@ class CommentIndexView(ListView):
     model = Comment
     context_object_name = 'comments'
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('article')
+
 
 class CommentForArticleCreateView(View):
     def post(self, request, *args, **kwargs):
@@ -19,12 +26,23 @@ class CommentForArticleCreateView(View):
         article_pk = kwargs.get('pk')
         article = get_object_or_404(Article, pk=article_pk)
         if form.is_valid():
-            Comment.objects.create(
-                author=form.cleaned_data['author'],
-                text=form.cleaned_data['text'],
-                article=article
-
-            )
+            if writebehind.is_enabled():
+                writebehind.comment_writer.submit(Comment(
+                    author=form.cleaned_data['author'],
+                    text=form.cleaned_data['text'],
+                    article=article
+                ))
+                response = redirect('article_view', pk=article_pk)
+                response.set_cookie(writebehind.PENDING_COOKIE, article_pk, max_age=60)
+                return response
+            with transaction.atomic():
+                comment = Comment.objects.create(
+                    author=form.cleaned_data['author'],
+                    text=form.cleaned_data['text'],
+                    article=article
+
+                )
+                counters.comment_added(comment)
             return redirect('article_view', pk=article_pk)
         else:
             return render(request, 'article/article.html', context={'form': form, 'article': article})
@@ -40,13 +58,15 @@ class CommentCreateView(View):
     def post(self, request, *args, **kwargs):
         form = CommentForm(data=request.POST)
         if form.is_valid():
-            comment = Comment.objects.create(
-                author=form.cleaned_data['author'],
-                text=form.cleaned_data['text'],
-                article=form.cleaned_data['article'],
-
-            )
-            return redirect('comment_index', pk=comment.article.pk)
+            with transaction.atomic():
+                comment = Comment.objects.create(
+                    author=form.cleaned_data['author'],
+                    text=form.cleaned_data['text'],
+                    article=form.cleaned_data['article'],
+
+                )
+                counters.comment_added(comment)
+            return redirect('comment_index')
         else:
             return render(request, 'comment/create.html', context={'form': form})
 
@@ -56,21 +76,39 @@ class CommentCreateView(View):
 class CommentUpdateView(UpdateView):
     model = Comment
     template_name = 'comment/update.html'
-    form_class = ArticleCommentForm
+    form_class = CommentForm
     context_object_name = 'comment'
 
+    def get_object(self, queryset=None):
+        comment = super().get_object(queryset)
+        self.loaded_article_id = comment.article_id
+        return comment
+
+    def form_valid(self, form):
+        with transaction.atomic():
+            response = super().form_valid(form)
+            counters.comment_changed(self.object, self.loaded_article_id)
+        return response
+
     def get_success_url(self):
         return reverse('article_view', kwargs={'pk': self.object.article.pk})
 
 
 
 
+@method_decorator(primary_only, name='dispatch')
 class CommentDeleteView(DeleteView):
     model = Comment
 
     def get(self, request, *args, **kwargs):
         return self.delete(request, *args, **kwargs)
 
+    def delete(self, request, *args, **kwargs):
+        with transaction.atomic():
+            response = super().delete(request, *args, **kwargs)
+            counters.comment_removed(self.object.article_id)
+        return response
+
     def get_success_url(self):
         return reverse('article_view', kwargs={'pk': self.object.article.pk})
 
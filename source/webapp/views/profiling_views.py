@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.contrib.auth.decorators import user_passes_test
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+
+from webapp.profiling import slow_requests
+
+
+# not staff_member_required, which imports the admin even with BLOG_ADMIN=0,
+# and without the admin there is no admin:login to send anonymous users to
+@method_decorator(user_passes_test(lambda user: user.is_active and user.is_staff,
+                                   login_url='admin:login' if settings.ADMIN_ENABLED else settings.LOGIN_URL),
+                  name='dispatch')
+class SlowRequestsView(View):
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({'requests': slow_requests.items()[::-1]})
@@ -0,0 +1,54 @@
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+from webapp import autocomplete
+
+
+logger = logging.getLogger(__name__)
+
+
+def template_names():
+    """Names of the templates in TEMPLATES DIRS and in webapp/templates."""
+    directories = [directory for engine in settings.TEMPLATES for directory in engine.get('DIRS', [])]
+    directories.append(os.path.join(apps.get_app_config('webapp').path, 'templates'))
+    names = []
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            for filename in files:
+                if filename.endswith('.html'):
+                    names.append(os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/'))
+    return sorted(set(names))
+
+
+def warm_templates():
+    # with the cached loader every compiled template stays in the process
+    names = template_names()
+    for name in names:
+        get_template(name)
+    return names
+
+
+def warm_urls():
+    resolver = get_resolver()
+    # builds the reverse lookup tables and compiles every pattern
+    resolver.reverse_dict
+    return resolver
+
+
+def warm_up():
+    start = time.perf_counter()
+    warm_urls()
+    templates = warm_templates()
+    try:
+        for index in autocomplete.KINDS.values():
+            index.get_index()
+    except DatabaseError:
+        logger.warning('Autocomplete indexes not loaded, the database is not ready', exc_info=True)
+    logger.info('Warmed up %d templates and the URLconf in %.3fs', len(templates), time.perf_counter() - start)
@@ -0,0 +1,161 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+
+from webapp import autocomplete, counters
+from webapp.models import Article, Comment
+from webapp.signals import comments_changed
+
+
+logger = logging.getLogger(__name__)
+
+PENDING_COOKIE = 'pending_comment'
+
+
+class CommentWriteBehind:
+    """
+    Collects validated comments in an in-process queue and writes them with
+    bulk_create, one transaction per batch of up to batch_size comments or
+    max_delay seconds. Pending comments are written at interpreter exit.
+    A batch that fails with a DatabaseError is retried, the comments are
+    only dropped, with an error naming them, once every attempt failed.
+    """
+
+    def __init__(self, batch_size, max_delay, retries=0, retry_delay=0):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.queue = queue.Queue()
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._registered = False
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='comment-write-behind', daemon=True)
+            self._thread.start()
+            if not self._registered:
+                atexit.register(self.stop)
+                self._registered = True
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def submit(self, comment):
+        self.start()
+        with self._condition:
+            self._pending += 1
+        self.queue.put(comment)
+
+    def _drain(self, batch, deadline=None):
+        while len(batch) < self.batch_size:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            try:
+                if timeout is None:
+                    batch.append(self.queue.get_nowait())
+                elif timeout <= 0:
+                    break
+                else:
+                    batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                first = self.queue.get(timeout=self.max_delay)
+            except queue.Empty:
+                continue
+            self._write(self._drain([first], time.monotonic() + self.max_delay))
+            close_old_connections()
+
+    def flush(self):
+        """Write everything queued so far and wait for batches already in flight."""
+        while True:
+            batch = self._drain([])
+            if not batch:
+                break
+            self._write(batch)
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending == 0, timeout=max(self.max_delay * 4, 1))
+
+    def _write(self, batch):
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    self._write_batch(batch)
+                    return
+                except DatabaseError:
+                    if attempt == self.retries:
+                        raise
+                    logger.warning('Could not write %d queued comments, retrying', len(batch), exc_info=True)
+                    time.sleep(self.retry_delay * 2 ** attempt)
+        except Exception:
+            logger.exception('Dropped %d queued comments after %d attempts: %s', len(batch), attempt + 1,
+                             ', '.join('article {} by {!r}'.format(comment.article_id, comment.author)
+                                       for comment in batch))
+        finally:
+            with self._condition:
+                self._pending -= len(batch)
+                self._condition.notify_all()
+
+    def _write_batch(self, batch):
+        with self._write_lock, transaction.atomic():
+            # skip comments whose article was deleted while they waited
+            existing = set(Article.objects.filter(pk__in={comment.article_id for comment in batch})
+                           .values_list('pk', flat=True))
+            comments = [comment for comment in batch if comment.article_id in existing]
+            Comment.objects.bulk_create(comments)
+            added = {}
+            for comment in comments:
+                count, last = added.get(comment.article_id, (0, comment.updated_at))
+                added[comment.article_id] = (count + 1, max(last, comment.updated_at))
+            for article_id, (count, last) in added.items():
+                counters.comments_added(article_id, count, last)
+            comments_changed(list(added))
+            for comment in comments:
+                autocomplete.authors.add(comment.author)
+
+
+comment_writer = CommentWriteBehind(settings.COMMENT_WRITE_BEHIND['BATCH_SIZE'],
+                                    settings.COMMENT_WRITE_BEHIND['MAX_DELAY'],
+                                    settings.COMMENT_WRITE_BEHIND['RETRIES'],
+                                    settings.COMMENT_WRITE_BEHIND['RETRY_DELAY'])
+
+
+def is_enabled():
+    return settings.COMMENT_WRITE_BEHIND['ENABLED']
+
+
+def read_your_writes(view):
+    """
+    Flush queued comments before serving a client that has just posted one,
+    so the redirect to the article shows the author their comment.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if PENDING_COOKIE not in request.COOKIES:
+            return view(request, *args, **kwargs)
+        comment_writer.flush()
+        response = view(request, *args, **kwargs)
+        response.delete_cookie(PENDING_COOKIE)
+        return response
+    return wrapper